@@ -26,6 +26,7 @@ setup(
             "packages": [
                 "ttkbootstrap.utility",
                 "ttkbootstrap",
+                "batchdownload",    # 包内多为延迟导入，整包打进去
             ],
         },
     },
@@ -1,13 +1,30 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import asyncio, threading, subprocess, sys, os, datetime, time, pathlib
+import asyncio, threading, subprocess, sys, os, datetime
 import traceback
 from pathlib import Path
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from ttkbootstrap import *
-import aiohttp
-from batchdownload import BatchDownload          # 你的原有抓取类
+import ttkbootstrap                 # 只为给 ttk 控件加上 bootstyle 参数，不再导入整个命名空间
+from batchdownload.progress import CallbackSink
+
+if hasattr(ttkbootstrap, "enable_global_api"):  # 新版不在导入时修改 ttk 控件，需要显式打开
+    ttkbootstrap.enable_global_api()
+try:                                # 1.x 在 ttkbootstrap.tooltip，2.x 从包或 widgets 导出
+    from ttkbootstrap.tooltip import ToolTip
+except ImportError:
+    try:
+        from ttkbootstrap import ToolTip
+    except ImportError:
+        try:
+            from ttkbootstrap.widgets import ToolTip
+        except ImportError:         # 都没有就不显示提示框
+            ToolTip = None
+
+RULE_TIP = ("逗号分隔，任意一条命中即算：\n"
+            "  abc 文件名包含 abc；*.iso 通配符；drivers/*/old/* 含 / 的按路径匹配\n"
+            "  re:^v\\d+ 正则；size>100M / mtime<2024-01-01 大小/日期条件\n"
+            "所有规则都不分大小写（*.ZIP 也匹配 a.zip）")
 
 # ---------------- 异步协程托管 ----------------
 class AsyncRunner(threading.Thread):
@@ -27,6 +44,15 @@ def fmt_size(b: int) -> str:
     """字节 -> MB 字符串"""
     return f"{b / 1024 / 1024:.2f}"
 
+def fmt_speed(bps: float) -> str:
+    return f"{bps / 1024 / 1024:.2f} MB/s"
+
+STATE_TEXT = {"waiting": "等待中", "downloading": "下载中", "done": "已完成",
+              "skipped": "已存在", "failed": "失败", "stopped": "已停止"}
+FILTERS = {"全部": None, "进行中": {"下载中", "失败"}, "下载中": {"下载中"},
+           "等待中": {"等待中"}, "已完成": {"已完成", "已存在"}, "失败": {"失败", "已停止"}}
+FRAME_MS = 100                  # 界面刷新间隔
+
 def fmt_time(sec: float) -> str:
     """秒 -> 00:00:00"""
     h, s = divmod(int(sec), 3600)
@@ -36,43 +62,111 @@ def fmt_time(sec: float) -> str:
 
 # ---------------- Treeview 行管理 ----------------
 class RowManager:
-    """负责 Treeview 增删改"""
-    def __init__(self, tree: ttk.Treeview):
-        self.tree = tree
-        self._iid_map = {}          # url -> iid
-
+    """
+    虚拟列表：所有行只存在内存里，Treeview 固定只放可见窗口那几行
+    update() 只改内存，flush() 每帧调用一次，逐格比对后只写变化的单元格
+    """
+    COLS = ("state", "name", "size", "prog", "speed", "eta")
+    BLANK = ("",) * 6
+
+    def __init__(self, tree: ttk.Treeview, scroll: ttk.Scrollbar):
+        self.tree, self.scroll = tree, scroll
+        self._rows = {}             # url -> [state, name, size, prog, speed, eta]
+        self._order = []            # 插入顺序
+        self._view = []             # 过滤后的 url 列表
+        self._filter = None         # 要显示的状态文本集合，None 为全部
+        self._top = 0               # 可见窗口第一行在 _view 中的下标
+        self._slots = []            # 可见窗口的 iid
+        self._shown = []            # 每个槽当前显示的值
+        self._dirty_view = True
+        tree.bind("<Configure>", self._on_resize)
+        tree.bind("<MouseWheel>", lambda e: self._scroll_by(-1 if e.delta > 0 else 1, 3))
+        tree.bind("<Button-4>", lambda e: self._scroll_by(-1, 3))
+        tree.bind("<Button-5>", lambda e: self._scroll_by(1, 3))
+        scroll.configure(command=self._on_scroll)
+
+    # ---------- 数据 ----------
     def add(self, url: str, name: str, size: int):
-        iid = self.tree.insert(
-            "", "end",
-            values=("等待中", name, fmt_size(size), 0, "0 MB/s", "00:00:00")
-        )
-        self._iid_map[url] = iid
-        return iid
+        if url not in self._rows:
+            self._order.append(url)
+        self._rows[url] = ["等待中", name, fmt_size(size), 0, "", ""]
+        self._dirty_view = True
 
     def update(self, url: str, **kw):
-        iid = self._iid_map.get(url)
-        if not iid:
+        vals = self._rows.get(url)
+        if vals is None:
             return
-        old = self.tree.item(iid, "values")
-        # 按顺序替换
-        vals = list(old)
-        if "state" in kw:
-            vals[0] = kw["state"]
-        if "prog" in kw:
-            vals[3] = kw["prog"]
-        if "speed" in kw:
-            vals[4] = kw["speed"]
-        if "eta" in kw:
-            vals[5] = kw["eta"]
-        self.tree.item(iid, values=vals)
+        for key, v in kw.items():
+            idx = self.COLS.index(key)
+            if key == "state" and self._filter is not None and vals[idx] != v:
+                self._dirty_view = True         # 状态变了可能进出过滤结果
+            vals[idx] = v
 
     def set_done(self, url: str, cost: float):
-        self.update(url, state="已完成", prog=100, eta=f"✔ {fmt_time(cost)}")
+        self.update(url, state="已完成", prog=100, speed="", eta=f"✔ {fmt_time(cost)}")
 
     def clear(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        self._iid_map.clear()
+        self._rows.clear()
+        self._order.clear()
+        self._top = 0
+        self._dirty_view = True
+        self.flush()
+
+    def set_filter(self, states=None):
+        self._filter = set(states) if states else None
+        self._top = 0
+        self._dirty_view = True
+        self.flush()
+
+    # ---------- 渲染 ----------
+    def flush(self):
+        if self._dirty_view:
+            self._view = [u for u in self._order
+                          if self._filter is None or self._rows[u][0] in self._filter]
+            self._dirty_view = False
+        n = len(self._slots)
+        self._top = max(0, min(self._top, len(self._view) - n))
+        for i, iid in enumerate(self._slots):
+            j = self._top + i
+            vals = tuple(self._rows[self._view[j]]) if j < len(self._view) else self.BLANK
+            old = self._shown[i]
+            if vals == old:
+                continue
+            for col, v, o in zip(self.COLS, vals, old):
+                if v != o:
+                    self.tree.set(iid, col, v)
+            self._shown[i] = vals
+        total = len(self._view)
+        if total <= n:
+            self.scroll.set(0, 1)
+        else:
+            self.scroll.set(self._top / total, (self._top + n) / total)
+
+    def _on_resize(self, event):
+        style = ttk.Style()
+        row_h = int(style.lookup("Treeview", "rowheight") or 20)
+        n = max(1, (event.height - row_h - 4) // row_h)     # 扣掉表头
+        while len(self._slots) < n:
+            self._slots.append(self.tree.insert("", "end", values=self.BLANK))
+            self._shown.append(self.BLANK)
+        while len(self._slots) > n:
+            self.tree.delete(self._slots.pop())
+            self._shown.pop()
+        self.flush()
+
+    def _scroll_by(self, sign: int, rows: int):
+        self._top = max(0, self._top + sign * rows)
+        self.flush()
+        return "break"
+
+    def _on_scroll(self, *args):
+        n = len(self._slots)
+        if args[0] == "moveto":
+            self._top = int(float(args[1]) * len(self._view))
+        elif args[0] == "scroll":
+            self._top += int(args[1]) * (n if args[2] == "pages" else 1)
+        self._top = max(0, self._top)
+        self.flush()
 
 
 # ---------------- 主界面 ----------------
@@ -92,12 +186,22 @@ class App(ttk.Frame):
         self.white_var = tk.StringVar(value="")          # 白名单
         self.black_var = tk.StringVar(value="")          # 黑名单
         self.workers_var = tk.IntVar(value=5)
+        self.rate_var  = tk.DoubleVar(value=0)           # 限速 MB/s，0 不限
+        self.rate_var.trace_add("write", self._on_rate_change)
+        self.filter_var = tk.StringVar(value="全部")
         self.running   = False
         self.crawler   = None
+        self._loop     = None           # 下载线程的事件循环，停止时把 stop() 投递过去
+        self._browser_ready = False     # 浏览器组件每个进程只安装/检查一次
+        # 下载线程推来的快照先攒在这里，界面每帧合并处理一次
+        self._pending = {}          # url -> 最新的文件状态
+        self._summary = None
+        self._pending_lock = threading.Lock()
         self._build_ui()
 
         # Treeview 行管理器
-        self.row_mgr = RowManager(self.tree)
+        self.row_mgr = RowManager(self.tree, self.tree_scroll)
+        self.after(FRAME_MS, self._frame)
 
     # ---------- UI ----------
     def _build_ui(self):
@@ -118,16 +222,24 @@ class App(ttk.Frame):
         # 白名单 & 深度
         r1 = ttk.Frame(frm); r1.grid(row=2, column=0, columnspan=2, sticky="ew", pady=4)
         ttk.Label(r1, text="下载文件:").pack(side="left", padx=(0, 4))
-        ttk.Entry(r1, textvariable=self.white_var).pack(side="left", fill="x", expand=True, padx=(0, 8))
+        ent = ttk.Entry(r1, textvariable=self.white_var)
+        ent.pack(side="left", fill="x", expand=True, padx=(0, 8))
+        if ToolTip is not None:
+            ToolTip(ent, text=RULE_TIP)
         ttk.Label(r1, text="深度:").pack(side="left", padx=(0, 4))
         ttk.Spinbox(r1, from_=0, to=20, textvariable=self.depth_var, width=4).pack(side="left")
 
         # 黑名单 & 并发
         r2 = ttk.Frame(frm); r2.grid(row=3, column=0, columnspan=2, sticky="ew", pady=4)
         ttk.Label(r2, text="排除文件:").pack(side="left", padx=(0, 4))
-        ttk.Entry(r2, textvariable=self.black_var).pack(side="left", fill="x", expand=True, padx=(0, 8))
+        ent = ttk.Entry(r2, textvariable=self.black_var)
+        ent.pack(side="left", fill="x", expand=True, padx=(0, 8))
+        if ToolTip is not None:
+            ToolTip(ent, text=RULE_TIP)
         ttk.Label(r2, text="并发:").pack(side="left", padx=(0, 4))
         ttk.Spinbox(r2, from_=1, to=20, textvariable=self.workers_var, width=4).pack(side="left")
+        ttk.Label(r2, text="限速(MB/s):").pack(side="left", padx=(8, 4))
+        ttk.Spinbox(r2, from_=0, to=1000, increment=0.5, textvariable=self.rate_var, width=6).pack(side="left")
 
         # ---- 控制按钮 ----
         btn_frm = ttk.Frame(self)
@@ -138,6 +250,13 @@ class App(ttk.Frame):
         self.stop_btn.pack(side="left", padx=4)
         ttk.Button(btn_frm, text="打开目录", command=self._open_dir, bootstyle="info-outline").pack(side="left", padx=4)
         ttk.Button(btn_frm, text="导出日志", command=self._export_log, bootstyle="dark-outline").pack(side="left", padx=4)
+        ttk.Label(btn_frm, text="显示:").pack(side="left", padx=(12, 4))
+        flt = ttk.Combobox(btn_frm, textvariable=self.filter_var, values=list(FILTERS),
+                           state="readonly", width=8)
+        flt.pack(side="left")
+        flt.bind("<<ComboboxSelected>>", lambda e: self.row_mgr.set_filter(FILTERS[self.filter_var.get()]))
+        self.status_lbl = ttk.Label(btn_frm, text="")
+        self.status_lbl.pack(side="left", padx=(12, 0))
 
         # ---- Treeview ----
         self.tree = ttk.Treeview(
@@ -145,9 +264,9 @@ class App(ttk.Frame):
             show="headings", selectmode="browse", height=8
         )
         self.tree.grid(row=2, column=0, sticky="nsew", pady=(4, 0))
-        scroll = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
-        scroll.grid(row=2, column=1, sticky="ns", pady=(4, 0))
-        self.tree.configure(yscrollcommand=scroll.set)
+        # 滚动条由 RowManager 接管：Treeview 里只有可见的几行
+        self.tree_scroll = ttk.Scrollbar(self, orient="vertical")
+        self.tree_scroll.grid(row=2, column=1, sticky="ns", pady=(4, 0))
 
         # ---- 进度条 ----
         self.pbar = ttk.Progressbar(self, orient="horizontal", mode="determinate")
@@ -204,6 +323,18 @@ class App(ttk.Frame):
             Path(f).write_text(log_text, encoding="utf-8")
             messagebox.showinfo("成功", f"已导出日志：\n{f}")
 
+    def _rate_bps(self):
+        try:
+            mb = float(self.rate_var.get())
+        except (tk.TclError, ValueError):
+            return None
+        return mb * 1024 * 1024 if mb > 0 else None
+
+    def _on_rate_change(self, *_):
+        """运行中改限速，立即生效，不中断下载"""
+        if self.crawler:
+            self.crawler.set_rate_limit(self._rate_bps())
+
     def _set_running(self, flag: bool):
         self.running = flag
         st = "disabled" if flag else "normal"
@@ -221,21 +352,26 @@ class App(ttk.Frame):
 
         # 解析白/黑名单
         white_raw = self.white_var.get().strip()
-        white = {e.strip().lower() for e in white_raw.split(",") if e.strip()} if white_raw else set()
+        white = {e.strip() for e in white_raw.split(",") if e.strip()} if white_raw else set()
         black_raw = self.black_var.get().strip()
-        black = {e.strip().lower() for e in black_raw.split(",") if e.strip()} if black_raw else set()
+        black = {e.strip() for e in black_raw.split(",") if e.strip()} if black_raw else set()
         depth   = self.depth_var.get()
         workers = self.workers_var.get()
 
         self._log("开始扫描...")
         self._set_running(True)
-        self.row_mgr.clear()
+        self.after(0, self.row_mgr.clear)
 
+        self._loop = asyncio.get_running_loop()
+        from batchdownload import BatchDownload    # 在后台线程里导入，不拖慢窗口启动
         crawler = BatchDownload(
             url=url, depth=depth, store_dir=str(store),
-            white=white, black=black, download_html=False
+            white=white, black=black, download_html=False,
+            rate_limit=self._rate_bps()
         )
         self.crawler = crawler
+        # 订阅进度快照（后台线程里产生，攒起来由界面按帧处理）；扫描阶段也要看得到
+        crawler.subscribe(CallbackSink(self._enqueue))
 
         try:
             links = await crawler.fetch()          # 返回 List[Dict{url,name,size}]
@@ -243,53 +379,83 @@ class App(ttk.Frame):
             if total == 0:
                 self._log("未找到文件"); return
 
-            # 日志：待下载
-            self._log(f"\n===== 待下载文件（{total}个） =====")
-            for item in links:
-                self._log(f"  {item['name']}  {fmt_size(item['size'])} MB")
-            # 日志：被排除
-            if crawler.excluded:
-                self._log(f"\n===== 被排除文件/目录（{len(crawler.excluded)}个） =====")
-                for x in crawler.excluded:
-                    self._log(f"  排除: {x}")
-
-            # 插入 Treeview
-            for item in links:
-                self.row_mgr.add(item["url"], item["name"], item["size"])
-
-            self.pbar.configure(maximum=total, value=0)
-            counter = {"done": 0}
-
-            # 为 crawler 注入实时回调
-            original_dl = crawler._dl_one
-
-            async def wrapped_dl(session:aiohttp.ClientSession, url:str, save_path:pathlib.Path, total_bytes:int):
-                t0 = time.time()
-                self.after(0, lambda: self.row_mgr.update(url, state="下载中"))
-                # 调用真实下载
-                await original_dl(session, url, save_path, total_bytes)
-                cost = time.time() - t0
-                counter["done"] += 1
-                self.after(0, lambda: self.pbar.configure(value=counter["done"]))
-                self.after(0, lambda: self.row_mgr.set_done(url, cost))
-                self.after(0, lambda: self._log(
-                    f"[完成] {save_path.name}  {fmt_size(total_bytes)} MB  用时 {fmt_time(cost)}"
-                ))
-
-            crawler._dl_one = wrapped_dl
+            self.after(0, self._show_links, links, list(crawler.excluded))
             await crawler.download(max_workers=workers)
             self._log("全部完成！")
         except Exception as e:
             self._log(f"错误: {e}")
             traceback.print_exc()
         finally:
+            crawler.close()
             self._set_running(False)
             self.crawler = None
 
+    def _show_links(self, links, excluded):
+        # 日志一次性插入，几万行也只触发一次重绘
+        lines = [f"\n===== 待下载文件（{len(links)}个） ====="]
+        lines += [f"  {item['name']}  {fmt_size(item['size'])} MB" for item in links]
+        if excluded:
+            lines.append(f"\n===== 被排除文件/目录（{len(excluded)}个） =====")
+            lines += [f"  排除: {x}" for x in excluded]
+        self._log("\n".join(lines))
+        for item in links:
+            self.row_mgr.add(item["url"], item["name"], item["size"])
+        self.pbar.configure(maximum=len(links), value=0)
+        self.row_mgr.flush()
+
+    def _enqueue(self, snap: dict):
+        """下载线程调用：同一文件只保留最新状态"""
+        with self._pending_lock:
+            for f in snap["files"]:
+                self._pending[f["url"]] = f
+            self._summary = snap
+
+    def _frame(self):
+        with self._pending_lock:
+            files, self._pending = self._pending, {}
+            snap, self._summary = self._summary, None
+        if snap is not None:
+            self._apply(files.values(), snap)
+        self.row_mgr.flush()
+        self.after(FRAME_MS, self._frame)
+
+    def _apply(self, files, snap: dict):
+        """把一帧内累积的变化写进行数据，完成/失败的文件批量写日志"""
+        logs = []
+        for f in files:
+            state, total = f["state"], f["total"]
+            prog = int(f["done"] * 100 / total) if total else 0
+            if state == "downloading":
+                eta = fmt_time(f["eta"]) if f["eta"] is not None else "--:--:--"
+                self.row_mgr.update(f["url"], state=STATE_TEXT[state], prog=prog,
+                                    speed=fmt_speed(f["rate"]), eta=eta)
+            elif state in ("done", "skipped"):
+                self.row_mgr.set_done(f["url"], f["elapsed"])
+                self.row_mgr.update(f["url"], state=STATE_TEXT[state])
+                if state == "done":
+                    logs.append(f"[完成] {f['name']}  {fmt_size(total)} MB  用时 {fmt_time(f['elapsed'])}")
+            else:
+                self.row_mgr.update(f["url"], state=STATE_TEXT.get(state, state), speed="", eta="")
+                if state == "failed":
+                    logs.append(f"[失败] {f['name']}")
+        if logs:
+            self._log("\n".join(logs))
+        if snap["phase"] == "scan":
+            self.status_lbl.config(text=f"扫描目录 {snap['dirs_done']}/{snap['dirs_total']}")
+            return
+        st = snap["states"]
+        self.pbar.configure(value=sum(st.get(k, 0) for k in ("done", "skipped", "failed")))
+        eta = fmt_time(snap["eta"]) if snap["eta"] is not None else "--:--:--"
+        self.status_lbl.config(text=f"{fmt_speed(snap['rate'])}  剩余 {eta}  "
+                                    f"{fmt_size(snap['bytes'])}/{fmt_size(snap['bytes_total'])} MB")
+
     # 开始/停止 与之前相同
     def _start(self):
         if self.running: return
         self._set_running(True)
+        if self._browser_ready:
+            AsyncRunner(self._run_crawler()).start()
+            return
         self.start_btn.config(text="安装中…", state="disabled", bootstyle="secondary")
         def install_then_run():
             try:
@@ -299,12 +465,13 @@ class App(ttk.Frame):
             except subprocess.CalledProcessError as e:
                 self.after(0, lambda: messagebox.showerror("安装失败", e.stdout))
                 self.after(0, self._set_running, False); return
+            self._browser_ready = True
             self.after(0, lambda: AsyncRunner(self._run_crawler()).start())
         threading.Thread(target=install_then_run, daemon=True).start()
 
     def _stop(self):
-        if self.crawler:
-            self.crawler.stop()
+        if self.crawler and self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.crawler.stop(), self._loop)
             self._log("已请求停止...")
             self.row_mgr.clear()
             self.pbar.configure(value=0)
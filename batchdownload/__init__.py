@@ -1,4 +1,19 @@
-from .crawler import BatchDownload
-
+"""
+BatchDownload 包入口
+重的模块（aiohttp、爬虫本体）在第一次访问 BatchDownload 时才导入，
+playwright 只在需要浏览器渲染时导入，tqdm 只在终端进度条里导入
+"""
 __all__ = ["BatchDownload"]
-__version__ = "0.1.0"
\ No newline at end of file
+__version__ = "0.1.0"
+
+
+def __getattr__(name):
+    if name == "BatchDownload":
+        from .crawler import BatchDownload
+        globals()["BatchDownload"] = BatchDownload
+        return BatchDownload
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
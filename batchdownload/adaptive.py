@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按主机自适应的下载并发控制（AIMD）
+- 成功一轮（limit 个文件）且吞吐还在涨 -> 并发 +1
+- 吞吐明显下滑 / 首字节延迟飙升 / 连接错误 -> 并发 -1
+- 429/503 -> 并发减半，并按 Retry-After 暂停该主机
+所有调整都记在 changes 里，方便据此调整任务参数
+"""
+import asyncio, email.utils, time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+EWMA = 0.3
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After 可能是秒数也可能是 HTTP 日期"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostState:
+    __slots__ = ("host", "limit", "active", "cond", "blocked_until", "ok", "errors", "throttled",
+                 "window_bytes", "window_start", "window_ok", "last_bps", "bps", "ttfb", "base_ttfb")
+
+    def __init__(self, host: str, limit: int):
+        self.host = host
+        self.limit = limit
+        self.active = 0
+        self.cond = asyncio.Condition()
+        self.blocked_until = 0.0
+        self.ok = self.errors = self.throttled = 0
+        self.window_bytes = 0
+        self.window_start = time.monotonic()
+        self.window_ok = 0
+        self.last_bps: Optional[float] = None     # 上次加并发时的吞吐
+        self.bps = 0.0                            # 主机总吞吐（EWMA）
+        self.ttfb: Optional[float] = None         # 首字节延迟（EWMA）
+        self.base_ttfb: Optional[float] = None    # 观测到的最小首字节延迟
+
+
+class HostLimiter:
+    def __init__(self, min_limit: int = 1, max_limit: int = 8, initial: int = None):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.initial = min(self.max_limit, max(self.min_limit, initial or 2))
+        self._hosts: Dict[str, HostState] = {}
+        self.changes: List[dict] = []             # 每次调整：时间、主机、前后并发、原因
+
+    def _state(self, url: str) -> HostState:
+        host = urlparse(url).netloc
+        st = self._hosts.get(host)
+        if st is None:
+            st = self._hosts[host] = HostState(host, self.initial)
+        return st
+
+    # ---------- 占位 ----------
+    async def acquire(self, url: str):
+        st = self._state(url)
+        while True:
+            async with st.cond:
+                wait = st.blocked_until - time.monotonic()
+                if wait <= 0:
+                    if st.active < st.limit:
+                        st.active += 1
+                        return
+                    await st.cond.wait()
+                    continue
+            await asyncio.sleep(wait)
+
+    async def release(self, url: str):
+        st = self._state(url)
+        async with st.cond:
+            st.active -= 1
+            st.cond.notify_all()
+
+    async def ready(self, url: str):
+        """重试前调用：主机被 Retry-After 暂停时等到解除"""
+        wait = self._state(url).blocked_until - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    # ---------- 反馈 ----------
+    def on_response(self, url: str, ttfb: float):
+        st = self._state(url)
+        st.ttfb = ttfb if st.ttfb is None else (1 - EWMA) * st.ttfb + EWMA * ttfb
+        st.base_ttfb = ttfb if st.base_ttfb is None else min(st.base_ttfb, ttfb)
+
+    def on_success(self, url: str, nbytes: int):
+        st = self._state(url)
+        st.ok += 1
+        st.window_ok += 1
+        st.window_bytes += nbytes
+        if st.window_ok < st.limit:
+            return
+        now = time.monotonic()
+        bps = st.window_bytes / max(now - st.window_start, 1e-6)
+        st.bps = bps if not st.bps else (1 - EWMA) * st.bps + EWMA * bps
+        st.window_bytes, st.window_ok, st.window_start = 0, 0, now
+        if st.base_ttfb and st.ttfb and st.ttfb > 3 * st.base_ttfb + 0.05:
+            self._set(st, st.limit - 1, f"首字节延迟 {st.ttfb:.2f}s 远高于基线 {st.base_ttfb:.2f}s")
+        elif st.last_bps is not None and bps < 0.8 * st.last_bps:
+            self._set(st, st.limit - 1, f"吞吐下降 {st.last_bps:.0f} -> {bps:.0f} B/s")
+        elif st.last_bps is None or bps > 1.05 * st.last_bps:
+            st.last_bps = bps
+            self._set(st, st.limit + 1, f"吞吐上升 {bps:.0f} B/s")
+
+    def on_error(self, url: str, reason: str):
+        st = self._state(url)
+        st.errors += 1
+        self._set(st, st.limit - 1, f"错误 {reason}")
+
+    def on_throttle(self, url: str, status: int, retry_after: Optional[str] = None):
+        st = self._state(url)
+        st.throttled += 1
+        delay = parse_retry_after(retry_after)
+        st.blocked_until = max(st.blocked_until, time.monotonic() + (delay if delay is not None else 2.0))
+        st.last_bps = None
+        why = f"HTTP {status}" + (f" Retry-After {delay:.0f}s" if delay is not None else "")
+        self._set(st, st.limit // 2, why)
+
+    def _set(self, st: HostState, limit: int, reason: str):
+        limit = min(self.max_limit, max(self.min_limit, limit))
+        if limit == st.limit:
+            return
+        self.changes.append({"time": time.time(), "host": st.host,
+                             "from": st.limit, "to": limit, "reason": reason})
+        grew, st.limit = limit > st.limit, limit
+        if grew:                    # 放宽后唤醒等待者，acquire 里会重新检查 limit
+            asyncio.get_running_loop().create_task(self._notify(st))
+
+    @staticmethod
+    async def _notify(st: HostState):
+        async with st.cond:
+            st.cond.notify_all()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """当前各主机并发上限与统计"""
+        now = time.monotonic()
+        return {h: {"limit": st.limit, "active": st.active, "ok": st.ok, "errors": st.errors,
+                    "throttled": st.throttled, "bps": round(st.bps), "ttfb": st.ttfb,
+                    "paused": max(0.0, st.blocked_until - now)}
+                for h, st in self._hosts.items()}
@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准（不随正常使用加载）
+  python -m batchdownload.bench.memory -n 1000000     文件列表每项占用内存
+  python -m batchdownload.bench.run -o result.json   合成目录服务器上的爬取/下载速度、RSS、事件循环延迟
+  python -m batchdownload.bench.server --port 8080   单独启动合成目录服务器
+  python -m batchdownload.bench.imports --budget-ms 50   冷启动导入耗时，加载了重模块或超预算时退出码 1
+"""
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+冷启动导入基准：每个模块在全新子进程里导入，记耗时（取多次最小值）和顺带加载的重模块
+  python -m batchdownload.bench.imports --budget-ms 50
+  python -m batchdownload.bench.imports batchdownload.cli --budget-ms 400
+导入了不该加载的重模块（playwright/tqdm/GUI），或超过 --budget-ms 时退出码为 1，可直接放进 CI
+"""
+import argparse, json, subprocess, sys
+from typing import Dict
+
+TARGETS = ["batchdownload", "batchdownload.crawler", "batchdownload.cli"]
+# 普通导入路径上都不该出现的模块
+FORBIDDEN = ("playwright", "tqdm", "ttkbootstrap", "tkinter")
+
+_PROBE = """
+import sys, time, json
+t = time.perf_counter()
+import {mod}
+dt = time.perf_counter() - t
+print(json.dumps({{"seconds": dt, "modules": len(sys.modules),
+                  "loaded": sorted({{m.split(".")[0] for m in sys.modules}})}}))
+"""
+
+
+def probe(module: str) -> dict:
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE.format(mod=module)],
+                         capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["top"] = top_self_times(out.stderr)
+    return result
+
+
+def top_self_times(stderr: str, n: int = 5) -> Dict[str, float]:
+    """-X importtime 输出里自身耗时最多的 n 个模块（毫秒）"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if parts[0].strip().isdigit():
+            rows.append([parts[2].strip(), int(parts[0]) / 1000])
+    rows.sort(key=lambda r: -r[1])
+    return {name: round(ms, 2) for name, ms in rows[:n]}
+
+
+def measure(module: str, repeat: int) -> dict:
+    runs = [probe(module) for _ in range(max(1, repeat))]
+    best = min(runs, key=lambda r: r["seconds"])
+    return {"ms": round(best["seconds"] * 1000, 2), "modules": best["modules"],
+            "heavy": [m for m in FORBIDDEN if m in best["loaded"]], "top": best["top"]}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("modules", nargs="*", default=TARGETS)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--budget-ms", type=float, default=None, help="每个模块的导入耗时上限")
+    args = ap.parse_args(argv)
+    results: Dict[str, dict] = {m: measure(m, args.repeat) for m in args.modules}
+    ok = True
+    for r in results.values():
+        r["ok"] = not r["heavy"] and (args.budget_ms is None or r["ms"] <= args.budget_ms)
+        ok = ok and r["ok"]
+    print(json.dumps({"python": sys.version.split()[0], "budget_ms": args.budget_ms,
+                      "ok": ok, "results": results}, indent=2))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存基准：对合成目录服务器真跑一遍 fetch()（可选再 download()），记每个文件留下的内存（JSON）
+  python -m batchdownload.bench.memory --depth 2 --fanout 10 --files 200
+  python -m batchdownload.bench.memory --no-sizes --download
+  python -m batchdownload.bench.memory --synthetic -n 1000000 --per-dir 200
+统计的是阶段结束后 crawler 仍持有的内存（tracemalloc，已 gc），top 为占用最多的源文件
+--synthetic 只对比原来的 dict 列表和 FileList 本身，不经过爬虫
+"""
+import argparse, asyncio, gc, json, os, shutil, sys, tempfile, tracemalloc
+
+from ..records import FileList
+from .server import add_arguments
+
+BASE = "https://mirror.example.com/pub/drivers/"
+
+
+# ---------- 真实路径 ----------
+def retained(files: int, base: tracemalloc.Snapshot, n: int = 5) -> dict:
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    stats = tracemalloc.take_snapshot().compare_to(base, "filename")
+    top = {os.path.basename(s.traceback[0].filename): s.size_diff for s in stats[:n]}
+    return {"files": files, "bytes": current, "peak": peak,
+            "bytes_per_file": round(current / max(1, files), 1), "top": top}
+
+
+async def crawl(url: str, store: str, download: bool) -> dict:
+    from .. import BatchDownload
+    from ..progress import CallbackSink
+    crawler = BatchDownload(url, depth=64, store_dir=store, engine="static")
+    crawler.subscribe(CallbackSink(lambda snap: None))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.take_snapshot()
+        files = await crawler.fetch()
+        result = {"fetch": retained(len(files), base)}
+        if download:
+            if hasattr(tracemalloc, "reset_peak"):      # 3.9+；3.8 上下载阶段的 peak 含 fetch 阶段
+                tracemalloc.reset_peak()
+            await crawler.download(max_workers=8)
+            result["download"] = retained(len(files), base)
+    finally:
+        tracemalloc.stop()
+        crawler.close()
+    return result
+
+
+async def run_real(args) -> dict:
+    from .run import start_server
+    proc, url = await start_server(args)
+    store = tempfile.mkdtemp(prefix="bd-mem-")
+    try:
+        return await crawl(url, store, args.download)
+    finally:
+        proc.terminate()
+        await proc.wait()
+        shutil.rmtree(store, ignore_errors=True)
+
+
+# ---------- 只比较列表结构 ----------
+def synth_urls(n: int, per_dir: int):
+    """模拟镜像目录：每 per_dir 个文件一个二级目录"""
+    for i in range(n):
+        d = i // per_dir
+        yield f"{BASE}v{d // 100:04d}/build-{d:06d}/package-{i:08d}.tar.gz", i * 7 % 100000
+
+
+def as_dicts(n: int, per_dir: int):
+    out = []
+    for url, size in synth_urls(n, per_dir):
+        out.append({"url": url, "name": url.rpartition("/")[2], "size": size})
+    return out
+
+
+def as_filelist(n: int, per_dir: int):
+    out = FileList()
+    for url, size in synth_urls(n, per_dir):
+        out.append(url, size)
+    return out
+
+
+def measure(build, n: int, per_dir: int) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    obj = build(n, per_dir)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return {"bytes": current, "peak": peak, "bytes_per_entry": round(current / max(1, n), 1)}
+
+
+def run_synthetic(args) -> dict:
+    result = {"n": args.n, "per_dir": args.per_dir,
+              "dicts": measure(as_dicts, args.n, args.per_dir),
+              "filelist": measure(as_filelist, args.n, args.per_dir)}
+    result["ratio"] = round(result["dicts"]["bytes"] / max(1, result["filelist"]["bytes"]), 2)
+    return result
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(ap)
+    ap.set_defaults(depth=2, fanout=10, files=200, size="1K")      # 22200 个文件
+    ap.add_argument("--download", action="store_true", help="fetch 之后再下载，记下载结束时的占用")
+    ap.add_argument("--synthetic", action="store_true", help="只比较 dict 列表和 FileList")
+    ap.add_argument("-n", type=int, default=200_000, help="--synthetic 的文件数")
+    ap.add_argument("--per-dir", type=int, default=200, help="--synthetic 每个目录的文件数")
+    args = ap.parse_args(argv)
+    result = run_synthetic(args) if args.synthetic else asyncio.run(run_real(args))
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
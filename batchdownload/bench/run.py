@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬取 / 下载基准：以子进程启动合成目录服务器（bench.server），再用 BatchDownload 跑一遍
+  python -m batchdownload.bench.run --depth 3 --fanout 4 --files 20 --size 1M -o result.json
+  python -m batchdownload.bench.run --latency 0.02 --no-sizes --baseline old.json
+  python -m batchdownload.bench.run --size 32K --spread 0.9 --heavy 0.02 --bandwidth 2M --schedule crawl
+输出 JSON：fetch 目录/秒、请求数（含 HEAD）、download MB/秒、峰值 RSS、事件循环延迟
+--baseline 给出上一次的结果时附带各项指标的比值（新/旧）
+--url 可改为测已经在跑的服务器（此时没有服务端统计）
+"""
+import argparse, asyncio, json, platform, shutil, sys, tempfile, time
+from typing import Optional
+
+import aiohttp
+
+from .. import BatchDownload, __version__
+from ..meta import parse_size_arg
+from ..metrics import LoopLag
+from ..progress import CallbackSink
+from ..scheduler import POLICIES, Scheduler
+from .server import add_arguments
+
+try:
+    import resource
+except ImportError:                 # Windows
+    resource = None
+
+
+def peak_rss() -> Optional[int]:
+    """进程峰值常驻内存（字节）；Linux 的 ru_maxrss 单位是 KB，macOS 是字节"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+async def server_stats(session: aiohttp.ClientSession, url: str) -> Optional[dict]:
+    try:
+        async with session.get(url + "__stats?reset=1") as resp:
+            return await resp.json() if resp.status == 200 else None
+    except (aiohttp.ClientError, ValueError):
+        return None
+
+
+async def bench(url: str, store: str, args) -> dict:
+    lag = LoopLag()
+    crawler = BatchDownload(url, depth=64, store_dir=store, engine="static",
+                            scan_workers=args.scan_workers)
+    crawler.subscribe(CallbackSink(lambda snap: None))      # 不挂 tqdm，免得终端输出计进耗时
+    result = {}
+    async with aiohttp.ClientSession() as session:
+        await server_stats(session, url)
+        lag.start()
+        try:
+            t0 = time.perf_counter()
+            files = await crawler.fetch()
+            elapsed = time.perf_counter() - t0
+            dirs = crawler.progress.dirs_done
+            result["fetch"] = {"seconds": round(elapsed, 3), "dirs": dirs, "files": len(files),
+                               "dirs_per_s": round(dirs / elapsed, 1) if elapsed else None,
+                               "loop_lag": lag.take(), "server": await server_stats(session, url),
+                               "peak_rss": peak_rss()}
+            if not args.no_download:
+                t0 = time.perf_counter()
+                await crawler.download(max_workers=args.workers, segments=args.segments,
+                                       segment_min_size=parse_size_arg(args.segment_min),
+                                       schedule=Scheduler(args.schedule, small_size=parse_size_arg(args.small_size)))
+                elapsed = time.perf_counter() - t0
+                snap = crawler.progress.snapshot()
+                result["download"] = {"seconds": round(elapsed, 3), "bytes": snap["bytes"],
+                                      "mb_per_s": round(snap["bytes"] / elapsed / 1e6, 2) if elapsed else None,
+                                      "states": snap["states"], "loop_lag": lag.take(),
+                                      "server": await server_stats(session, url),
+                                      "peak_rss": peak_rss()}
+        finally:
+            await lag.stop()
+    result["metrics"] = crawler.metrics.to_dict(files=False)     # 各环节耗时分布、请求/错误计数
+    return result
+
+
+# 比较时取的指标：(阶段, 键)
+METRICS = [("fetch", "dirs_per_s"), ("fetch", "seconds"), ("fetch", "peak_rss"),
+           ("download", "mb_per_s"), ("download", "seconds"), ("download", "peak_rss")]
+
+
+def compare(new: dict, old: dict) -> dict:
+    out = {}
+    for phase, key in METRICS:
+        a, b = new.get(phase, {}).get(key), old.get(phase, {}).get(key)
+        if a is not None and b:
+            out[f"{phase}.{key}"] = round(a / b, 3)
+    for phase in ("fetch", "download"):
+        a = (new.get(phase, {}).get("server") or {}).get("HEAD")
+        b = (old.get(phase, {}).get("server") or {}).get("HEAD")
+        if a is not None and b:
+            out[f"{phase}.HEAD"] = round(a / b, 3)
+    return out
+
+
+async def start_server(args):
+    """以子进程启动 bench.server，读出第一行的地址"""
+    argv = [sys.executable, "-m", "batchdownload.bench.server",
+            "--depth", str(args.depth), "--fanout", str(args.fanout), "--files", str(args.files),
+            "--size", args.size, "--spread", str(args.spread), "--heavy", str(args.heavy),
+            "--latency", str(args.latency),
+            "--error-rate", str(args.error_rate)]
+    if args.bandwidth:
+        argv += ["--bandwidth", args.bandwidth]
+    argv += ["--no-ranges"] * args.no_ranges + ["--no-sizes"] * args.no_sizes
+    proc = await asyncio.create_subprocess_exec(*argv, stdout=asyncio.subprocess.PIPE)
+    line = await asyncio.wait_for(proc.stdout.readline(), 30)
+    if not line:
+        raise RuntimeError("基准服务器启动失败")
+    return proc, line.decode().strip()
+
+
+async def amain(args) -> dict:
+    proc = None
+    url = args.url
+    if url is None:
+        proc, url = await start_server(args)
+    store = tempfile.mkdtemp(prefix="bd-bench-")
+    try:
+        result = await bench(url if url.endswith("/") else url + "/", store, args)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            await proc.wait()
+        if not args.keep:
+            shutil.rmtree(store, ignore_errors=True)
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "keep")}
+    return {"version": __version__, "python": platform.python_version(),
+            "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": params, **result}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(ap)
+    ap.add_argument("--url", default=None, help="测已有的服务器，不启动合成服务器")
+    ap.add_argument("--scan-workers", type=int, default=8)
+    ap.add_argument("--workers", type=int, default=8, help="下载并发")
+    ap.add_argument("--segments", type=int, default=1)
+    ap.add_argument("--segment-min", default="64M")
+    ap.add_argument("--schedule", default="largest", choices=POLICIES, help="下载顺序")
+    ap.add_argument("--small-size", default="256K", help="小文件车道阈值，0 为不分车道")
+    ap.add_argument("--no-download", action="store_true", help="只测 fetch")
+    ap.add_argument("--keep", action="store_true", help="保留下载目录")
+    ap.add_argument("--baseline", default=None, help="上一次的结果 JSON，输出比值")
+    ap.add_argument("-o", "--output", default=None, help="结果写入文件，默认 stdout")
+    args = ap.parse_args(argv)
+    result = asyncio.run(amain(args))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            result["compare"] = compare(result, json.load(f))
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成目录服务器：不落盘，按参数生成 nginx autoindex 风格的目录树
+  python -m batchdownload.bench.server --depth 3 --fanout 4 --files 20 --size 256K --port 8080
+目录为 d0/ d1/ ...，每个目录 files 个 f0.bin ...；文件内容由路径决定，重复请求结果一致
+可注入：每个请求的延迟、每个响应的带宽、Range 开关、按比例返回 503
+GET /__stats 返回各方法请求数、列表页数、发送字节数（?reset=1 同时清零）
+"""
+import argparse, asyncio, random, zlib
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from aiohttp import web
+
+from ..meta import parse_size_arg
+
+BLOCK = random.Random(0).getrandbits(8 * 65536).to_bytes(65536, "little")
+LAST_MODIFIED = "Mon, 01 Jan 2024 10:00:00 GMT"
+CHUNK = 64 * 1024
+
+
+class Tree:
+    """
+    虚拟目录树：深度 depth、每层 fanout 个子目录、每个目录 files 个文件，大小在 size*(1±spread) 内
+    heavy 比例的文件再放大 HEAVY 倍（长尾分布，测调度）
+    """
+    HEAVY = 32
+
+    def __init__(self, depth: int = 3, fanout: int = 4, files: int = 10,
+                 size: int = 64 * 1024, spread: float = 0.5, heavy: float = 0):
+        self.depth, self.fanout, self.files = depth, fanout, files
+        self.size, self.spread, self.heavy = size, spread, heavy
+
+    @property
+    def dir_count(self) -> int:
+        return sum(self.fanout ** k for k in range(self.depth + 1))
+
+    @property
+    def file_count(self) -> int:
+        return self.dir_count * self.files
+
+    def is_dir(self, parts: List[str]) -> bool:
+        if len(parts) > self.depth:
+            return False
+        return all(p[:1] == "d" and p[1:].isdigit() and int(p[1:]) < self.fanout for p in parts)
+
+    def is_file(self, parts: List[str]) -> bool:
+        name = parts[-1] if parts else ""
+        return (self.is_dir(parts[:-1]) and name[:1] == "f" and name.endswith(".bin")
+                and name[1:-4].isdigit() and int(name[1:-4]) < self.files)
+
+    def file_size(self, path: str) -> int:
+        h = zlib.crc32(path.encode()) / 0xFFFFFFFF
+        size = max(0, int(self.size * (1 + self.spread * (2 * h - 1))))
+        # 另取一个加盐的 crc32 决定是否放大（adler32 对短路径分布很不均匀，会远超 heavy 比例）
+        if self.heavy and zlib.crc32(b"heavy:" + path.encode()) / 0xFFFFFFFF < self.heavy:
+            size *= self.HEAVY
+        return size
+
+    def children(self, parts: List[str]) -> Tuple[List[str], List[str]]:
+        dirs = [f"d{i}" for i in range(self.fanout)] if len(parts) < self.depth else []
+        return dirs, [f"f{i}.bin" for i in range(self.files)]
+
+    @staticmethod
+    def read(path: str, start: int, end: int) -> bytes:
+        """[start, end) 的内容：固定 64KB 块按路径错开一个偏移循环铺满"""
+        shift = zlib.crc32(path.encode()) % len(BLOCK)
+        out = bytearray()
+        pos = start
+        while pos < end:
+            i = (pos + shift) % len(BLOCK)
+            piece = BLOCK[i: i + (end - pos)]
+            out += piece
+            pos += len(piece)
+        return bytes(out)
+
+
+class SyntheticServer:
+    """
+    async with SyntheticServer(Tree(...), latency=0.01) as srv:
+        BatchDownload(srv.url, ...)
+    """
+
+    def __init__(self, tree: Tree = None, latency: float = 0, bandwidth: float = None,
+                 ranges: bool = True, error_rate: float = 0, sizes: bool = True,
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+        self.tree = tree or Tree()
+        self.latency = latency          # 秒，每个请求
+        self.bandwidth = bandwidth      # 字节/秒，每个响应单独计
+        self.ranges = ranges
+        self.error_rate = error_rate
+        self.sizes = sizes              # 列表页是否带大小列（不带时爬虫要 HEAD 补大小）
+        self.host, self.port = host, port
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/"
+
+    async def start(self) -> "SyntheticServer":
+        app = web.Application()
+        app.router.add_route("*", "/{p:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ---------- 请求处理 ----------
+    async def _handle(self, req: web.Request) -> web.StreamResponse:
+        path = req.match_info["p"]
+        if path == "__stats":
+            stats = dict(self.stats)
+            if "reset" in req.query:
+                self.stats.clear()
+            return web.json_response(stats)
+        self.stats[req.method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return web.Response(status=503)
+        parts = [p for p in path.split("/") if p]
+        if path == "" or path.endswith("/"):
+            if not self.tree.is_dir(parts):
+                raise web.HTTPNotFound()
+            return self._listing(parts)
+        if self.tree.is_dir(parts):
+            raise web.HTTPFound("/" + path + "/")
+        if not self.tree.is_file(parts):
+            raise web.HTTPNotFound()
+        return await self._file(req, path)
+
+    def _listing(self, parts: List[str]) -> web.Response:
+        self.stats["listings"] += 1
+        dirs, files = self.tree.children(parts)
+        base = "/".join(parts)
+        rows = ['<a href="../">../</a>']
+        rows += [f'<a href="{d}/">{d}/</a>{" " * (50 - len(d))}01-Jan-2024 10:00       -' for d in dirs]
+        for f in files:
+            if not self.sizes:      # 只有链接的简单列表
+                rows.append(f'<a href="{f}">{f}</a>')
+                continue
+            size = self.tree.file_size(f"{base}/{f}".lstrip("/"))
+            rows.append(f'<a href="{f}">{f}</a>{" " * (51 - len(f))}01-Jan-2024 10:00 {size:>8}')
+        body = (f"<html><head><title>Index of /{base}</title></head><body>"
+                f"<h1>Index of /{base}</h1><hr><pre>" + "\n".join(rows) + "</pre><hr></body></html>")
+        return web.Response(text=body, content_type="text/html")
+
+    async def _file(self, req: web.Request, path: str) -> web.StreamResponse:
+        size = self.tree.file_size(path)
+        start, end, status = 0, size, 200
+        headers = {"ETag": f'"{zlib.crc32(path.encode()):x}-{size:x}"',
+                   "Last-Modified": LAST_MODIFIED,
+                   "Accept-Ranges": "bytes" if self.ranges else "none"}
+        rng = req.headers.get("Range", "")
+        if self.ranges and rng.startswith("bytes="):
+            a, _, b = rng[6:].split(",")[0].partition("-")
+            start = int(a) if a else max(0, size - int(b))
+            end = min(size, int(b) + 1) if a and b else size
+            if start >= size:
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        resp = web.StreamResponse(status=status, headers=headers)
+        resp.content_type = "application/octet-stream"
+        resp.content_length = end - start
+        await resp.prepare(req)
+        if req.method == "HEAD":
+            return resp
+        pos = start
+        try:
+            while pos < end:
+                n = min(CHUNK, end - pos)
+                await resp.write(self.tree.read(path, pos, pos + n))
+                self.stats["bytes"] += n
+                pos += n
+                if self.bandwidth:
+                    await asyncio.sleep(n / self.bandwidth)
+            await resp.write_eof()
+        except ConnectionError:
+            self.stats["aborted"] += 1  # 客户端中途断开（停止、分段取消等）
+        return resp
+
+
+def add_arguments(ap: argparse.ArgumentParser):
+    """服务器参数，bench.run 也复用"""
+    ap.add_argument("--depth", type=int, default=3, help="目录深度")
+    ap.add_argument("--fanout", type=int, default=4, help="每个目录的子目录数")
+    ap.add_argument("--files", type=int, default=10, help="每个目录的文件数")
+    ap.add_argument("--size", default="64K", help="平均文件大小，支持 K/M/G")
+    ap.add_argument("--spread", type=float, default=0.5, help="文件大小浮动比例")
+    ap.add_argument("--heavy", type=float, default=0, help=f"该比例的文件放大 {Tree.HEAVY} 倍")
+    ap.add_argument("--latency", type=float, default=0, help="每个请求延迟（秒）")
+    ap.add_argument("--bandwidth", default=None, help="每个响应的带宽（字节/秒，支持 K/M/G）")
+    ap.add_argument("--no-ranges", action="store_true", help="不支持 Range")
+    ap.add_argument("--no-sizes", action="store_true", help="列表页不给大小（爬虫需要 HEAD）")
+    ap.add_argument("--error-rate", type=float, default=0, help="按比例返回 503")
+
+
+def from_args(args, port: int = 0) -> SyntheticServer:
+    tree = Tree(args.depth, args.fanout, args.files, parse_size_arg(args.size), args.spread, args.heavy)
+    return SyntheticServer(tree, args.latency, args.bandwidth and parse_size_arg(args.bandwidth),
+                           not args.no_ranges, args.error_rate, not args.no_sizes, port=port)
+
+
+async def serve(srv: SyntheticServer):
+    await srv.start()
+    print(srv.url, flush=True)      # 第一行输出地址，bench.run 以子进程启动时读取
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await srv.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(ap)
+    ap.add_argument("--port", type=int, default=0, help="端口，0 为随机")
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(serve(from_args(args, args.port)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JS 渲染目录页用的 Chromium 页面池
+一个浏览器 + 一个 context（拦截图片/字体/媒体请求），最多 size 个 page 并发渲染
+不再等 networkidle + 固定 1 秒：页面 DOM 就绪后轮询 a[href] 数量，连续 quiet 毫秒不变即认为加载完
+同一个实例可传给多个 BatchDownload（engine="browser"/"auto"），进程内只启动一次浏览器：
+
+    async with BrowserPool(size=8) as pool:
+        await asyncio.gather(BatchDownload(u1, browser=pool).fetch(),
+                             BatchDownload(u2, browser=pool).fetch())
+"""
+import asyncio, contextlib
+from typing import List, Set
+
+# playwright 很重，只在第一次真正启动浏览器时导入（见 start()）
+BLOCK = frozenset({"image", "font", "media"})
+
+# 每次轮询顺带滚到底触发懒加载；锚点数 quiet 毫秒内没变化返回真，一直没有锚点（空目录）多等 10 倍
+_STABLE_JS = """quiet => {
+    window.scrollTo(0, document.body ? document.body.scrollHeight : 0);
+    const n = document.querySelectorAll("a[href]").length;
+    const s = window.__bdAnchors || (window.__bdAnchors = {n: -1, t: 0});
+    const now = performance.now();
+    if (n !== s.n) { s.n = n; s.t = now; return false; }
+    return now - s.t >= (n > 0 ? quiet : quiet * 10);
+}"""
+
+
+class BrowserPool:
+    """start() 幂等、并发安全；page() 借出一个空闲 page，没有空闲且未满 size 时新建"""
+
+    def __init__(self, size: int = 4, headless: bool = True, user_agent: str = "Mozilla/5.0",
+                 block: Set[str] = BLOCK, quiet: int = 300, timeout: int = 30_000):
+        self.size = max(1, size)
+        self.headless = headless
+        self.user_agent = user_agent
+        self.block = frozenset(block or ())
+        self.quiet = quiet          # 锚点数量保持不变多少毫秒算稳定
+        self.timeout = timeout      # 单页总超时（毫秒），到点按已有的锚点返回
+        self._pw = None
+        self._browser = None
+        self._context = None
+        self._idle: asyncio.Queue = None
+        self._slots: asyncio.Semaphore = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def started(self) -> bool:
+        return self._context is not None
+
+    async def start(self) -> "BrowserPool":
+        async with self._lock:
+            if self._context is not None:
+                return self
+            from playwright.async_api import async_playwright
+            self._pw = await async_playwright().start()
+            try:
+                self._browser = await self._pw.chromium.launch(headless=self.headless)
+                context = await self._browser.new_context(user_agent=self.user_agent)
+                if self.block:
+                    await context.route("**/*", self._route)
+            except BaseException:
+                await self._pw.stop()
+                self._pw = self._browser = None
+                raise
+            self._idle, self._slots = asyncio.Queue(), asyncio.Semaphore(self.size)
+            self._context = context
+        return self
+
+    async def close(self):
+        async with self._lock:
+            if self._browser is not None:
+                await self._browser.close()
+            if self._pw is not None:
+                await self._pw.stop()
+            self._pw = self._browser = self._context = self._idle = self._slots = None
+
+    async def _route(self, route):
+        if route.request.resource_type in self.block:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    @contextlib.asynccontextmanager
+    async def page(self):
+        """page 本身不能并发 goto，借出期间独占；出错的 page 直接关掉不回收"""
+        await self.start()
+        async with self._slots:
+            page = self._idle.get_nowait() if not self._idle.empty() else await self._context.new_page()
+            try:
+                yield page
+            except BaseException:
+                with contextlib.suppress(Exception):
+                    await page.close()
+                raise
+            self._idle.put_nowait(page)
+
+    async def render(self, url: str) -> List[str]:
+        """渲染 url，返回页面里所有 a[href] 的绝对地址"""
+        from playwright.async_api import TimeoutError as PageTimeout
+        async with self.page() as page:
+            await page.goto(url, wait_until="domcontentloaded", timeout=self.timeout)
+            try:
+                await page.wait_for_function(_STABLE_JS, arg=self.quiet, polling=100,
+                                             timeout=self.timeout)
+            except PageTimeout:
+                pass                # 锚点一直在变（无限滚动等），按现有内容返回
+            return await page.eval_on_selector_all("a[href]", "els => els.map(e => e.href)")
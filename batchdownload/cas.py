@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容寻址去重库（默认 store_dir/.cas/ab/cdef...，按 sha256 命名）
+相同内容只存一份，其他路径用 reflink（写时复制）或硬链接指向它，都不支持才复制
+下载前先预判：校验清单里的 sha256，或同主机强 ETag + 大小上次对应的摘要，命中就直接链接不下载
+多个 store_dir（多个镜像）可共用同一个库，但必须在同一文件系统上才能链接
+"""
+import os, pathlib, shutil, sqlite3, sys, threading, time
+from typing import Optional
+
+FICLONE = 0x40049409                # Linux ioctl：btrfs/xfs 等写时复制克隆
+
+
+class ContentStore:
+    DIR = ".cas"
+    ALGO = "sha256"
+
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()       # put/materialize 在线程池里跑
+        self._reflink = sys.platform == "linux"
+        self.stored = 0             # 新入库的内容数
+        self.linked = 0             # 链接到已有内容的文件数
+        self.saved_disk = 0         # 省下的磁盘字节（复制回退不算）
+        self.saved_download = 0     # 省下的下载字节
+
+    def open(self) -> "ContentStore":
+        if self._db is not None:
+            return self
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.root / "hints.db"))
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS hints("
+            " host TEXT, etag TEXT, size INTEGER, digest TEXT, updated REAL,"
+            " PRIMARY KEY(host, etag, size))")
+        self._db.commit()
+        return self
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    # ---------- 查询 ----------
+    def blob(self, digest: str) -> pathlib.Path:
+        return self.root / digest[:2] / digest[2:]
+
+    def size(self, digest: str) -> Optional[int]:
+        try:
+            return self.blob(digest).stat().st_size
+        except OSError:
+            return None
+
+    def hint(self, host: str, etag: str, size: int) -> Optional[str]:
+        """
+        同主机、同一强 ETag、同大小上次下到的内容摘要
+        不跨主机：不同服务器的 ETag（如 nginx 的 mtime-size）可能恰好相同但内容不同
+        """
+        if not etag or etag.startswith("W/") or not size:
+            return None
+        row = self._db.execute("SELECT digest FROM hints WHERE host=? AND etag=? AND size=?",
+                               (host, etag, size)).fetchone()
+        return row[0] if row else None
+
+    def remember(self, host: str, etag: str, size: int, digest: str):
+        if not etag or etag.startswith("W/") or not size:
+            return
+        self._db.execute("INSERT OR REPLACE INTO hints VALUES (?,?,?,?,?)",
+                         (host, etag, size, digest, time.time()))
+        self._db.commit()
+
+    def report(self) -> dict:
+        return {"stored": self.stored, "linked": self.linked,
+                "saved_disk": self.saved_disk, "saved_download": self.saved_download}
+
+    # ---------- 入库 / 取出（阻塞，放线程池里跑） ----------
+    def put(self, local: pathlib.Path, digest: str) -> int:
+        """
+        local 刚下完且摘要已知：库里已有同内容就把 local 换成指向它的链接，否则把 local 收进库
+        返回省下的磁盘字节
+        """
+        blob = self.blob(digest)
+        with self._lock:
+            if blob.exists():
+                if os.path.samefile(blob, local):
+                    return 0
+                size = blob.stat().st_size
+                if self._link(blob, local) == "copy":
+                    return 0
+                self.linked += 1
+                self.saved_disk += size
+                return size
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            self._link(local, blob)
+            self.stored += 1
+            return 0
+
+    def materialize(self, digest: str, local: pathlib.Path) -> int:
+        """库里已有的内容直接放到 local，返回文件大小"""
+        blob = self.blob(digest)
+        with self._lock:
+            size = blob.stat().st_size
+            method = self._link(blob, local)
+            self.linked += 1
+            self.saved_download += size
+            if method != "copy":
+                self.saved_disk += size
+            return size
+
+    def _link(self, src: pathlib.Path, dst: pathlib.Path) -> str:
+        """reflink -> 硬链接 -> 复制；先写临时名再原子替换，返回实际用的方式"""
+        tmp = dst.with_name(dst.name + ".cas-tmp")
+        tmp.unlink(missing_ok=True)
+        method = None
+        if self._reflink:
+            try:
+                import fcntl
+                with open(src, "rb") as s, open(tmp, "wb") as d:
+                    fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+                method = "reflink"
+            except OSError:
+                self._reflink = False       # 文件系统不支持，之后不再尝试
+                tmp.unlink(missing_ok=True)
+        if method is None:
+            try:
+                os.link(src, tmp)
+                method = "hardlink"
+            except OSError:
+                shutil.copyfile(src, tmp)
+                method = "copy"
+        os.replace(tmp, dst)
+        return method
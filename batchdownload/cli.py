@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令行入口（无界面）
+  batchdownload jobs.json --workers 32 --rate 100M --progress progress.jsonl
+  batchdownload https://a.example/pub/ https://b.example/pub/ --store-root mirror
+任务文件为 JSON：任务列表，或 {"defaults": {...}, "jobs": [...]}；每个任务是 URL 字符串或 dict：
+  {"url": "...", "store_dir": "...", "depth": 5, "ext": [".iso"], "black": ["old/"],
+   "workers": 8, "segments": 4, "segment_min_size": "64M", "pipeline": true,
+   "schedule": "largest", "priority": ["*.iso"], "small_size": "256K"}
+多台机器共享同一个 store_dir 时各加 --shard I/N，只跑第 I 片（见 batchdownload.shard）
+所有任务同时运行，共用一个连接池、浏览器页面池、全局限速和全局下载并发名额（--workers）
+进度按行输出 JSON（默认 stdout），每行带 "job" 和 "event"（progress / done）
+--metrics-port 开 Prometheus /metrics 端点，--metrics-file 在结束时写出指标（.prom 或 JSON）
+"""
+import argparse, asyncio, json, sys, time
+from typing import List, Optional
+from urllib.parse import unquote, urlparse
+
+import aiohttp
+
+from .adaptive import HostLimiter
+from .browser import BrowserPool
+from .crawler import BatchDownload
+from .meta import parse_size_arg
+from .metrics import Metrics
+from .progress import CallbackSink, JsonLinesSink
+from .ratelimit import Bandwidth
+from .retry import CircuitBreakers, RetryPolicy
+from .scheduler import POLICIES, Scheduler
+
+# 任务里可写的键：构造参数 / 下载参数
+CRAWL_KEYS = {"depth", "store_dir", "ext", "download_html", "white", "black", "scan_workers",
+              "engine", "incremental", "revalidate_subdirs", "host_rate_limits", "dedup",
+              "shard", "shard_depth"}
+DOWNLOAD_KEYS = {"workers", "chunk_size", "segments", "segment_min_size", "digests", "verify",
+                 "durability", "write_buffer", "queue_size", "schedule", "priority", "small_size"}
+SIZE_KEYS = {"segment_min_size", "write_buffer", "chunk_size", "small_size"}
+SCHEDULE_KEYS = ("schedule", "priority", "small_size")
+JOB_KEYS = CRAWL_KEYS | DOWNLOAD_KEYS | {"url", "name", "pipeline"}
+
+
+def load_jobs(targets: List[str]) -> List[dict]:
+    """参数里的 URL 直接成为任务，其余当任务文件读；defaults 合并进每个任务"""
+    jobs = []
+    for t in targets:
+        if urlparse(t).scheme in ("http", "https"):
+            jobs.append({"url": t})
+            continue
+        with open(t, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {"jobs": data}
+        defaults = data.get("defaults", {})
+        for job in data.get("jobs", []):
+            jobs.append({**defaults, **({"url": job} if isinstance(job, str) else job)})
+    for i, job in enumerate(jobs):
+        unknown = set(job) - JOB_KEYS
+        if unknown:
+            raise ValueError(f"任务 {job.get('url', i)} 有不认识的键: {sorted(unknown)}")
+        if "url" not in job:
+            raise ValueError(f"第 {i + 1} 个任务缺少 url")
+        if job.get("schedule", "largest") not in POLICIES:
+            raise ValueError(f"任务 {job['url']} 的 schedule 只能是 {POLICIES} 之一")
+        for k in SIZE_KEYS & set(job):
+            if isinstance(job[k], str):
+                job[k] = parse_size_arg(job[k])
+        job.setdefault("name", job.get("store_dir") or urlparse(job["url"]).netloc + urlparse(job["url"]).path)
+    return jobs
+
+
+class Runner:
+    """共享资源 + 同时运行多个任务"""
+
+    def __init__(self, jobs: List[dict], workers: int = 16, rate: float = None,
+                 host_limits=None, max_jobs: int = 0, store_root: str = None,
+                 progress=None, interval: float = 1.0, browser_pages: int = 4,
+                 metrics_port: int = None, metrics_file: str = None, retries: int = 6):
+        self.jobs = jobs
+        self.workers = max(1, workers)
+        self.bandwidth = Bandwidth(rate)
+        self.hosts = HostLimiter(*host_limits) if host_limits else None
+        self.retry = RetryPolicy(retries)
+        self.breakers = CircuitBreakers()   # 同一主机的多个任务一起熔断
+        self.store_root = store_root
+        self.interval = interval
+        self.browser_pages = browser_pages
+        self.max_jobs = max_jobs
+        self._max_jobs: asyncio.Semaphore = None
+        self._out = JsonLinesSink(progress if progress not in (None, "-") else None)
+        self.metrics = Metrics()            # 所有任务共用，按 host 标签区分
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.results: List[dict] = []
+
+    def _line(self, job: str, event: str, data: dict):
+        self._out({"job": job, "event": event, **data})
+
+    def _crawler(self, job: dict, session, browser) -> BatchDownload:
+        kw = {k: job[k] for k in CRAWL_KEYS & set(job)}
+        for k in ("ext", "white", "black"):
+            if k in kw:
+                kw[k] = set(kw[k])
+        if "shard" in kw:
+            kw["shard"] = tuple(kw["shard"])
+        if self.store_root and "store_dir" not in kw:
+            u = urlparse(job["url"])     # 同一主机的多个任务各用各的目录（续传日志不能共用）
+            kw["store_dir"] = f"{self.store_root}/{u.netloc}{unquote(u.path).rstrip('/')}"
+        crawler = BatchDownload(job["url"], rate_limit=self.bandwidth, progress_interval=self.interval,
+                                browser=browser, session=session, metrics=self.metrics, **kw)
+        crawler.subscribe(CallbackSink(lambda snap, name=job["name"]: self._line(name, "progress", snap)))
+        return crawler
+
+    async def _run_job(self, job: dict, session, browser, budget):
+        t0 = time.monotonic()
+        error = None
+        crawler = self._crawler(job, session, browser)
+        kw = {k: job[k] for k in DOWNLOAD_KEYS & set(job)}
+        kw["max_workers"] = kw.pop("workers", self.workers)
+        sched = {k: kw.pop(k) for k in SCHEDULE_KEYS if k in kw}
+        kw["schedule"] = Scheduler(sched.pop("schedule", "largest"), **sched)
+        kw.update(host_limits=self.hosts, budget=budget, retry=self.retry, breakers=self.breakers)
+        try:
+            if self._max_jobs is not None:
+                await self._max_jobs.acquire()
+            try:
+                if job.get("pipeline", True):
+                    await crawler.run(**kw)
+                else:
+                    kw.pop("queue_size", None)
+                    if await crawler.fetch():
+                        await crawler.download(**kw)
+            finally:
+                if self._max_jobs is not None:
+                    self._max_jobs.release()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        crawler.close()
+        snap = crawler.progress.snapshot()
+        result = {"url": job["url"], "store_dir": str(crawler.store_dir), "states": snap["states"],
+                  "bytes": snap["bytes"], "seconds": round(time.monotonic() - t0, 3),
+                  "verify_failed": crawler.verify_failed, "scan_failed": crawler.scan_failed,
+                  "error": error}
+        self.results.append(result)
+        self._line(job["name"], "done", result)
+
+    async def run(self) -> bool:
+        """全部任务成功（无异常、无失败文件、没有列不出来的目录）返回 True"""
+        timeout = aiohttp.ClientTimeout(total=None, connect=30)
+        conn = aiohttp.TCPConnector(limit=max(30, self.workers * 2))
+        budget = asyncio.Semaphore(self.workers)
+        if self.max_jobs > 0:
+            self._max_jobs = asyncio.Semaphore(self.max_jobs)
+        browser = BrowserPool(self.browser_pages)   # 只有任务真的需要渲染时才启动
+        endpoint = await self.metrics.serve(port=self.metrics_port) if self.metrics_port else None
+        try:
+            async with aiohttp.ClientSession(connector=conn, timeout=timeout,
+                                             headers={"User-Agent": "Mozilla/5.0"}) as session:
+                await asyncio.gather(*(self._run_job(j, session, browser, budget) for j in self.jobs))
+        finally:
+            await browser.close()
+            self._out.close()
+            if endpoint is not None:
+                await endpoint.cleanup()
+            if self.metrics_file:
+                self.metrics.dump(self.metrics_file)
+        return all(r["error"] is None and not r["states"].get("failed") and not r["scan_failed"]
+                   for r in self.results)
+
+
+def parse_limits(text: Optional[str]):
+    if not text:
+        return None
+    lo, _, hi = text.partition(",")
+    return int(lo), int(hi or lo)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="batchdownload", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("targets", nargs="+", help="任务文件（JSON）或目录 URL")
+    ap.add_argument("-w", "--workers", type=int, default=16, help="所有任务合计的下载并发")
+    ap.add_argument("--rate", default=None, help="全局限速（字节/秒，支持 K/M/G）")
+    ap.add_argument("--host-limits", default=None, help="按主机自适应并发范围，如 1,8")
+    ap.add_argument("--jobs", type=int, default=0, help="同时运行的任务数，0 为不限")
+    ap.add_argument("--store-root", default=None, help="没写 store_dir 的任务存到 <store-root>/<主机名>/<路径>")
+    ap.add_argument("--progress", default="-", help="进度 JSON 行输出文件，- 为 stdout")
+    ap.add_argument("--interval", type=float, default=1.0, help="进度输出间隔（秒）")
+    ap.add_argument("--browser-pages", type=int, default=4, help="JS 页面渲染并发")
+    ap.add_argument("--retries", type=int, default=6, help="每个文件连续尝试次数（指数退避 + 抖动）")
+    ap.add_argument("--metrics-port", type=int, default=None, help="在 127.0.0.1 上开 /metrics 端点")
+    ap.add_argument("--metrics-file", default=None, help="结束时写出指标，.prom 为 Prometheus 文本，否则 JSON")
+    ap.add_argument("--shard", default=None, help="只跑第 I 片（共 N 片），如 0/4；各任务都适用")
+    args = ap.parse_args(argv)
+    try:
+        jobs = load_jobs(args.targets)
+        if args.shard:
+            i, _, n = args.shard.partition("/")
+            for job in jobs:
+                job.update(shard=(int(i), int(n)))
+        rate = args.rate and parse_size_arg(args.rate)
+        limits = parse_limits(args.host_limits)
+    except (OSError, ValueError) as e:
+        ap.error(str(e))
+    runner = Runner(jobs, args.workers, rate, limits, args.jobs, args.store_root,
+                    args.progress, args.interval, args.browser_pages,
+                    args.metrics_port, args.metrics_file, args.retries)
+    try:
+        ok = asyncio.run(runner.run())
+    except KeyboardInterrupt:
+        return 130
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,19 +4,30 @@
 异步目录爬虫（可中断最终版）
 存储根目录不再带 /NVIDIA/vGPU/NVIDIA 前缀
 """
-import asyncio, aiohttp, aiofiles, pathlib
-from typing import List, Set
-from urllib.parse import urlparse, urljoin, unquote
-from playwright.async_api import async_playwright
-from tqdm.asyncio import tqdm_asyncio
-from tqdm import tqdm
-import sys
+import asyncio, aiohttp, contextlib, os, pathlib, sys, time
+from typing import AsyncIterator, Dict, List, Set, Tuple, Union
+from urllib.parse import urlparse, urljoin, urldefrag, unquote
 
-# ---------- Windows 长路径 ----------
-if sys.platform == "win32":
-    import ctypes, os
-    os.system('')
-    ctypes.windll.kernel32.SetConsoleMode(ctypes.windll.kernel32.GetStdHandle(-11), 7)
+from .adaptive import HostLimiter
+from .browser import BrowserPool
+from .cas import ContentStore
+from .filters import PathFilter
+from .ratelimit import Bandwidth
+from .index import CrawlIndex
+from .listing import Listing, fetch_listing
+from .meta import MetaCache, parse_mtime
+from .metrics import Metrics, host_of
+from .records import FileList
+from .scheduler import Lanes, Scheduler
+from .retry import FATAL, RETRY, CircuitBreakers, CircuitOpen, RetryPolicy, classify, retry_after
+from .progress import Progress, TqdmSink, SCAN, DOWNLOAD, SKIPPED, FAILED
+from .journal import Journal, DONE, PARTIAL
+from .verify import Hasher, hash_file, is_manifest, parse_manifest, url_key
+from .shard import Sharding, ShardStatus
+from .segment import RangeUnsupported, SAVE_EVERY, download_segmented, split
+from .writer import DURABILITY, FileWriter, commit, part_path, preallocate, write_file
+
+ENGINES = ("auto", "static", "browser")
 
 
 class BatchDownload:
@@ -28,79 +39,344 @@ class BatchDownload:
                  download_html: bool = False,
                  # ===== 新增两个参数 =====
                  white: Set[str] = None,
-                 black: Set[str] = None):
+                 black: Set[str] = None,
+                 scan_workers: int = 4,
+                 engine: str = "auto",
+                 incremental: bool = False,
+                 revalidate_subdirs: bool = True,
+                 rate_limit: Union[float, Bandwidth] = None,
+                 host_rate_limits: Dict[str, float] = None,
+                 progress_interval: float = 0.5,
+                 dedup: Union[bool, str] = False,
+                 browser: BrowserPool = None,
+                 session: aiohttp.ClientSession = None,
+                 shard: Tuple[int, int] = None,
+                 shard_depth: int = 1,
+                 metrics: Metrics = None):
         # ----------- 原来已有的赋值 ----------
         self.url = url.rstrip("/")
         self.depth = depth
         self.store_dir = pathlib.Path(store_dir or urlparse(url).netloc)
         self.ext = {e.lower() for e in (ext or set())}
         self.download_html = download_html
-        self._file_links: List[str] = []
+        self._file_links = FileList()    # 按列紧凑存储，逐项是 {"url","name","size"} 视图
         self._to_stop = asyncio.Event()
         self._running_tasks: Set[asyncio.Task] = set()
         # ----------- 新增两行 ----------
-        self.white = {w.strip().lower() for w in (white or set())}
-        self.black = {b.strip().lower() for b in (black or set())}
-        self.excluded = []          # 给前端打印用
+        # 规则写法见 filters.py：子串 / 通配符 / re: 正则 / size、mtime 条件（匹配不分大小写）
+        self.white = {w.strip() for w in (white or set()) if w.strip()}
+        self.black = {b.strip() for b in (black or set()) if b.strip()}
+        self._filter = PathFilter(self.white, self.black, self.ext, download_html)
+        self.excluded = []          # 给前端打印用（被剪掉的目录以 / 结尾，名字已 intern）
+        self.scan_failed: List[str] = []    # 重试后仍列不出来的目录（子树这次没扫到）
+        self.scan_workers = max(1, scan_workers)   # 并发列目录数
+        if engine not in ENGINES:
+            raise ValueError(f"engine 只能是 {ENGINES} 之一")
+        self.engine = engine        # auto: 静态优先，需要 JS 再启浏览器
+        self._session: aiohttp.ClientSession = None
+        self._shared_session = session      # 多个任务共用的连接池，由调用方关闭
+        # 浏览器页面池：传入的实例可被多个任务共用（由调用方关闭），否则按需启动、扫描完关闭
+        self._browser = browser
+        self._own_browser = browser is None
+        # 指标：请求/字节/错误计数、各环节耗时、逐文件结果（见 metrics.py），可传入多个任务共用的实例
+        self.metrics = metrics or Metrics()
+        self._meta = MetaCache(self.metrics)    # url -> 类型/大小/ETag，爬取与下载共用
+        # 分片：只扫描/下载 rendezvous 哈希归自己的子树和文件，日志按分片分文件（见 shard.py）
+        self._shard = Sharding(shard[0], shard[1], shard_depth) if shard else None
+        db_name = f".batchdownload.shard-{self._shard.label}.db" if self._shard else None
+        self._journal = Journal(self.store_dir, db_name)   # 断点续传日志
+        self._segments = 1
+        self._segment_min = 64 * 1024 * 1024
+        self._durability = "none"
+        self._write_buffer = 1024 * 1024
+        self._hosts: HostLimiter = None     # 按主机自适应并发，None 为固定 max_workers
+        self._budget: asyncio.Semaphore = None  # 多个任务共享的全局下载名额
+        self._retry = RetryPolicy()         # 错误分类 + 指数退避，见 retry.py
+        self._breakers = CircuitBreakers()  # 按主机熔断，可传入多个任务共享的实例
+        self._scheduler = Scheduler()       # 下载顺序 + 小文件车道，见 scheduler.py
+        # 校验：下载时边收边算摘要，和爬到的 SHA256SUMS/MD5SUMS 等清单比对
+        self._digest_algos: Tuple[str, ...] = ()
+        self._verify = True
+        self._manifests: Set[str] = set()
+        self._loaded_manifests: Set[str] = set()
+        self._expected: Dict[str, Tuple[str, str]] = {}   # url_key(url) -> (算法, hex)
+        self.digests: Dict[str, Dict[str, str]] = {}      # url -> {算法: hex}
+        self.verify_failed: List[str] = []
+        # 限速（字节/秒）：全局 + 按主机，可传入多个任务共享的 Bandwidth；运行中用 set_rate_limit() 调整
+        if isinstance(rate_limit, Bandwidth):
+            self.bandwidth = rate_limit
+            for host, r in (host_rate_limits or {}).items():
+                self.bandwidth.set_rate(r, host)
+        else:
+            self.bandwidth = Bandwidth(rate_limit, host_rate_limits)
+        # 增量爬取：目录页条件请求，每一层都单独校验（304 很便宜）；
+        # revalidate_subdirs=False 时 304 的目录连子树一起信任，直接复用索引（深层变化看不到）
+        self.incremental = incremental
+        self.revalidate_subdirs = revalidate_subdirs
+        self._index = CrawlIndex(self.store_dir, db_name)
+        self._tails: Dict[str, str] = {}   # 列表页文本，只在增量/日期条件需要时保留
+        self.delta = None           # {"added": [...], "changed": [...], "removed": [...]}
+        # 进度：热路径只累加计数，每 progress_interval 秒合并成快照推给 subscribe() 的 sink
+        self.progress = Progress(progress_interval)
+        # 内容去重：True 用 store_dir/.cas，传路径可让多个镜像任务共用一个库（需同一文件系统）
+        self._cas: ContentStore = None
+        if dedup:
+            self._cas = ContentStore(self.store_dir / ContentStore.DIR if dedup is True else dedup)
+        self._cas_linked: Set[str] = set()
+        # 分片的进度摘要写到 store_dir/.shards/，供 run_pool / 其他机器合并（不算用户 sink，不影响默认 tqdm）
+        self.shard_status = ShardStatus(self, self._shard) if self._shard is not None else None
 
     # ------------ 公共 API ------------
-    async def fetch(self) -> list[dict]:
+    async def fetch(self, delta: bool = False):
         """
         1. 爬取所有文件链接
-        2. 黑白名单过滤 -> dict 列表
-        3. 返回格式 [{"url": str, "name": str, "size": int}, ...]
-        4. self.excluded 记录被排除的文件名（供前端打印）
+        2. 黑白名单过滤 -> dict 列表（扫描时就过滤，黑名单路径规则覆盖的目录不下钻）
+        3. 返回 FileList，逐项可按 {"url": str, "name": str, "size": int} 取值（dict(item) 得到真 dict）
+        4. self.excluded 记录被排除的文件名（供前端打印）；self.scan_failed 记录列不出来的目录，
+           根目录列不出来直接抛异常
+        5. incremental 时 self.delta 记录与上次相比的新增/变化/删除；delta=True 直接返回它
         """
         self.excluded = []  # 清空前端打印用
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page(user_agent="Mozilla/5.0")
-
-            # 1. 收集原始链接（存 dict，size 先给 0）
-            top_links = await self._collect(page, self.url)
-            dirs = [h for h in top_links if self._depth(urlparse(h).path) == 0]
-            pbar_dir = tqdm(total=len(dirs), desc="ScanDirs", unit="dir")
-            for d in dirs:
-                await self._gather(page, d, 0)
-                pbar_dir.update(1)
-            pbar_dir.close()
-            await browser.close()
-
-        # 2. 去重
-        raw_links = list({v["url"]: v for v in self._file_links}.values())
-
-        # 3. 黑白名单过滤
-        filtered = []
-        for item in raw_links:
-            name = item["name"].lower()
-            if any(k in name for k in self.black):  # 黑名单优先
-                self.excluded.append(item["name"])
-                continue
-            if self.white and not any(k in name for k in self.white):  # 白名单
-                self.excluded.append(item["name"])
-                continue
-            filtered.append(item)
+        self._file_links = filtered = FileList()
+        self._tails = {}
+        async with self._crawling():
+            # 1. 广度优先收集链接，追加时按 URL 去重（size 先用列表页给的，没有就是 0；
+            #    名字/路径规则在扫描时已经过滤）
+            await self._scan(self._append_file)
 
-        # 4. 补全 size（HEAD 拿不到就保持 0）
-        async with aiohttp.ClientSession() as sess:
+            # 3. 补全 size（列表页没给精确值的才 HEAD，拿不到就保持 0；
+            #    增量时先用上次的，续传日志里已完成的用日志记录，都不发请求）
+            prev = self._index.files_under(self.url + "/") if self.incremental else {}
             for it in filtered:
-                if it["size"] == 0:
-                    try:
-                        async with sess.head(it["url"]) as resp:
-                            it["size"] = int(resp.headers.get("content-length", 0))
-                    except Exception:
-                        it["size"] = 0
+                old = prev.get(it["url"])
+                if it["size"] == 0 and old and old[1] == self._sig(it["url"]):
+                    it["size"] = old[0]
+            self._sizes_from_journal(filtered)
+            await self._fill_sizes(filtered)
+
+            # 4. 大小/日期条件：扫描时信息不全的在这里补判
+            if self._filter.needs_size or self._filter.needs_mtime:
+                filtered.retain(self._recheck)
+            if self.incremental:
+                self._update_delta(prev)
+        return self.delta if delta else self._file_links
+
+    async def crawl(self, queue_size: int = 1000) -> AsyncIterator[dict]:
+        """
+        流式爬取：边扫描边产出过滤、去重后的文件 dict
+        size 只用列表页给的（没有就是 0），不额外 HEAD；不计算 delta
+        大小/日期条件在信息未知时放行
+        消费方跟不上时队列写满，扫描协程随之挂起（背压）
+        """
+        self.excluded = []
+        self._tails = {}
+        out = asyncio.Queue(maxsize=max(1, queue_size))
+        seen: Set[str] = set()
+        end = object()
+
+        async def _emit(item: dict):
+            if item["url"] in seen:
+                return
+            seen.add(item["url"])
+            await out.put(item)
+
+        async def _produce():
+            try:
+                async with self._crawling():
+                    await self._scan(_emit)
+            finally:
+                await out.put(end)
+
+        producer = asyncio.create_task(_produce())
+        try:
+            while True:
+                item = await out.get()
+                if item is end:
+                    break
+                yield item
+            await producer                  # 把扫描异常抛给调用方
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    @contextlib.asynccontextmanager
+    async def _crawling(self):
+        """爬取期间的资源：共用连接池、增量索引、按需启动的浏览器"""
+        if self.incremental:
+            self._index.open()
+        try:
+            async with self._client(max(30, self.scan_workers * 2),
+                                    headers={"User-Agent": "Mozilla/5.0"}) as self._session:
+                try:
+                    if self.engine == "browser":
+                        await self._open_browser().start()
+                    yield
+                finally:
+                    await self._close_browser()
+        finally:
+            self._index.close()
+
+    def _append_file(self, item: dict):
+        self._file_links.append(item)
 
-        # 5. 写回实例变量并返回
-        self._file_links = filtered
-        return self._file_links
+    def _recheck(self, item: dict) -> bool:
+        """补全大小后按条件规则再判一次，被排除的记进 self.excluded"""
+        meta = self._meta.peek(item["url"])
+        mtime = parse_mtime(self._tails.get(item["url"], ""), meta.last_modified if meta else None)
+        if self._filter.allow_file(item["name"], self._rel_path(item["url"]),
+                                   item["size"] or None, mtime):
+            return True
+        self.excluded.append(sys.intern(item["name"]))
+        return False
+
+    def _sig(self, url: str) -> str:
+        """文件版本指纹：列表页里的日期/大小文本 + 已知的 ETag/Last-Modified"""
+        meta = self._meta.peek(url)
+        tag = (meta.etag or meta.last_modified or "") if meta is not None else ""
+        return " ".join(self._tails.get(url, "").split()) + "|" + tag
+
+    def _update_delta(self, prev: dict):
+        cur = {it["url"]: (it["size"], self._sig(it["url"])) for it in self._file_links}
+        # 这次列不出来的目录：子树里上次的文件不算删除，快照里也原样保留
+        failed = tuple(d.rstrip("/") + "/" for d in self.scan_failed)
+        if failed:
+            cur.update((u, v) for u, v in prev.items() if u not in cur and u.startswith(failed))
+        added, changed, removed = CrawlIndex.diff(prev, cur)
+        by_url = {it["url"]: it for it in self._file_links}
+        self.delta = {
+            "added": [by_url[u] for u in added],
+            "changed": [by_url[u] for u in changed],
+            "removed": [{"url": u, "name": pathlib.Path(u).name, "size": prev[u][0]}
+                        for u in removed],
+        }
+        if not self._to_stop.is_set():      # 扫描被中断时不覆盖快照
+            self._index.replace_files(self.url + "/", cur)
 
-    async def download(self, max_workers: int = 3, chunk_size: int = 8192):
+    async def download(self, max_workers: int = 3, chunk_size: int = 8192,
+                       segments: int = 1, segment_min_size: int = 64 * 1024 * 1024,
+                       host_limits: Union[Tuple[int, int], HostLimiter] = None,
+                       digests: Tuple[str, ...] = (), verify: bool = True,
+                       durability: str = "none", write_buffer: int = 1024 * 1024,
+                       budget: asyncio.Semaphore = None, retry: RetryPolicy = None,
+                       breakers: CircuitBreakers = None, schedule: Union[str, Scheduler] = "largest"):
+        """
+        segments > 1 时，不小于 segment_min_size 且服务器支持 Range 的文件
+        拆成 segments 段并发下载；不支持 Range 自动回退单连接
+        host_limits=(最小, 最大) 时每个主机的并发在此范围内按吞吐/错误自动调整
+        （不超过 max_workers），也可传入多个任务共享的 HostLimiter
+        digests 为下载时顺带计算的摘要算法（结果在 self.digests）；
+        verify 时按爬到的校验清单比对，不一致删掉重下一次，仍不一致记进 self.verify_failed
+        下载中写 <文件名>.part，攒够 write_buffer 字节才写一次盘，完成后改名；
+        durability 为 none / file（完成时 fsync）/ periodic（下载中定期 fsync），见 writer.py
+        budget 为多个任务共享的全局并发名额（每个文件下载期间占一个）
+        retry 为重试策略（次数、退避），breakers 为按主机的熔断器（可多任务共享），见 retry.py；
+        主机熔断期间它的文件放回队列末尾，重试用尽的文件保留 .part，下次运行续传
+        schedule 为下载顺序 largest / smallest / crawl，或 Scheduler(...)（优先级规则、小文件车道）
+        """
         if not self._file_links:
             raise RuntimeError("请先调用 fetch()")
-        self._main_task = asyncio.create_task(
-            self._download_all(max_workers, chunk_size)
-        )
+        self._configure(segments, segment_min_size, host_limits, digests, verify,
+                        durability, write_buffer, budget, retry, breakers, schedule)
+        await self._run_main(self._download_all(max_workers, chunk_size))
+
+    async def run(self, max_workers: int = 3, chunk_size: int = 8192,
+                  segments: int = 1, segment_min_size: int = 64 * 1024 * 1024,
+                  host_limits: Union[Tuple[int, int], HostLimiter] = None,
+                  digests: Tuple[str, ...] = (), verify: bool = True,
+                  durability: str = "none", write_buffer: int = 1024 * 1024,
+                  budget: asyncio.Semaphore = None, retry: RetryPolicy = None,
+                  breakers: CircuitBreakers = None, schedule: Union[str, Scheduler] = "largest",
+                  queue_size: int = 1000):
+        """
+        流水线模式：crawl() 发现的文件直接送进下载池，扫描和下载同时进行
+        参数同 download()；queue_size 为扫描结果缓冲上限
+        校验清单可能晚于文件被发现：已读到清单的文件边收边算，其余的结束时从磁盘回读比对
+        schedule 只在待下载缓冲区内排序（文件还在陆续发现）
+        """
+        self._configure(segments, segment_min_size, host_limits, digests, verify,
+                        durability, write_buffer, budget, retry, breakers, schedule)
+        await self._run_main(self._download_stream([self.crawl(queue_size)], max_workers, chunk_size))
+
+    def subscribe(self, sink):
+        """
+        订阅进度快照：sink(snapshot) 在事件循环线程里调用，可选 close()（crawler.close() 时调用）
+        没有任何订阅时终端显示一条 tqdm 汇总进度条
+        """
+        return self.progress.subscribe(sink)
+
+    def close(self):
+        """不再使用时调用：关闭订阅的 sink（fetch()/download() 结束时不会关）"""
+        self.progress.shutdown()
+
+    def set_rate_limit(self, rate: float = None, host: str = None):
+        """运行中调整限速（字节/秒，None/0 取消），可从 GUI 线程直接调用，不中断传输"""
+        self.bandwidth.set_rate(rate, host)
+
+    def host_stats(self) -> dict:
+        """各主机当前并发上限、吞吐、错误统计、每次调整的原因，以及熔断状态"""
+        if self._hosts is None:
+            return {"hosts": {}, "changes": [], "circuits": self._breakers.snapshot()}
+        return {"hosts": self._hosts.snapshot(), "changes": list(self._hosts.changes),
+                "circuits": self._breakers.snapshot()}
+
+    def dedup_report(self) -> dict:
+        """去重统计：入库/链接的文件数，省下的磁盘和下载字节"""
+        return self._cas.report() if self._cas is not None else {}
+
+    def _configure(self, segments: int, segment_min_size: int, host_limits,
+                   digests: Tuple[str, ...] = (), verify: bool = True,
+                   durability: str = "none", write_buffer: int = 1024 * 1024,
+                   budget: asyncio.Semaphore = None, retry: RetryPolicy = None,
+                   breakers: CircuitBreakers = None, schedule: Union[str, Scheduler] = "largest"):
+        if durability not in DURABILITY:
+            raise ValueError(f"durability 只能是 {DURABILITY} 之一")
+        self._durability = durability
+        self._write_buffer = write_buffer
+        self._budget = budget
+        self._retry = retry or RetryPolicy()
+        if breakers is not None:
+            self._breakers = breakers
+        self._scheduler = schedule if isinstance(schedule, Scheduler) else Scheduler(schedule)
+        self._digest_algos = tuple(a.lower() for a in digests)
+        self._verify = verify
+        self.verify_failed = []
+        self._segments = max(1, segments)
+        self._segment_min = segment_min_size
+        if isinstance(host_limits, HostLimiter) or host_limits is None:
+            self._hosts = host_limits
+        else:
+            self._hosts = HostLimiter(*host_limits)
+
+    @contextlib.asynccontextmanager
+    async def _client(self, limit: int, **kwargs):
+        """传入了共享 session 就直接用（不关闭），否则新建一个连接池上限为 limit 的"""
+        if self._shared_session is not None:
+            yield self._shared_session
+            return
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=limit), **kwargs) as s:
+            yield s
+
+    @contextlib.contextmanager
+    def _phase(self, phase: str):
+        bar = None
+        if not self.progress.has_sinks:
+            bar = self.progress.subscribe(TqdmSink())   # 自己加的终端进度条，阶段结束就收掉
+        if self.shard_status is not None:
+            self.progress.unsubscribe(self.shard_status)
+            self.progress.subscribe(self.shard_status)
+        self.progress.open(phase)
+        self.metrics.start()
+        try:
+            yield
+        finally:
+            self.metrics.stop()
+            self.progress.close(phase)
+            if bar is not None:
+                self.progress.unsubscribe(bar)
+                bar.close()
+
+    async def _run_main(self, coro):
+        self._main_task = asyncio.create_task(coro)
         try:
             await self._main_task
         except asyncio.CancelledError:
@@ -115,136 +391,816 @@ class BatchDownload:
 
     # ------------ 内部实现 ------------
     def _depth(self, abs_path: str) -> int:
-        prefix = urlparse(self.url).path
-        if abs_path.startswith(prefix):
-            abs_path = abs_path[len(prefix):].lstrip("/")
-        return abs_path.count("/")
-
-    def _allowed(self, url: str) -> bool:
-        suf = pathlib.Path(url).suffix.lower()
-        if not self.ext:
-            return True
-        return suf in self.ext
+        """相对根目录的层级：根下直接子项为 0，与结尾 / 无关；不在根目录下返回 -1"""
+        prefix = urlparse(self.url).path.rstrip("/")
+        if abs_path != prefix and not abs_path.startswith(prefix + "/"):
+            return -1
+        return len([s for s in abs_path[len(prefix):].split("/") if s]) - 1
 
-    async def _collect(self, page, base_url: str):
-        await page.goto(base_url, wait_until="networkidle", timeout=30_000)
-        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        await page.wait_for_timeout(1_000)
-        hrefs = await page.eval_on_selector_all("a[href]", "els => els.map(e=>e.href)")
-        return {urljoin(base_url, h) for h in hrefs}
+    def _rel_path(self, url: str) -> str:
+        """相对根目录的路径（解码后），过滤规则和本地路径共用"""
+        rel_path = unquote(urlparse(url).path).lstrip("/")
+        prefix_path = urlparse(self.url).path.lstrip("/")
+        if rel_path.startswith(prefix_path):
+            rel_path = rel_path[len(prefix_path):].lstrip("/")
+        return rel_path
 
-    async def _gather(self, page, base_url: str, cur_depth: int):
-        if cur_depth > self.depth:
-            return
-        links = await self._collect(page, base_url)
-        for h in links:
-            d = self._depth(urlparse(h).path)
-            if d == cur_depth + 1:
-                # 改进的目录检测逻辑
-                is_dir = False
+    async def _collect(self, base_url: str, trusted: bool = False) -> Listing:
+        """
+        列目录：static/auto 先走 aiohttp 解析，auto 下页面需要 JS 才交给浏览器
+        links 为 {绝对链接: 链接后的列表文本}
+        增量模式下带条件请求；304 或父目录未变（trusted）时直接用索引里的子链接
+        """
+        m = self.metrics
+        cached = self._index.get_dir(base_url) if self.incremental else None
+        if cached is not None and trusted:
+            m.inc("listings_total", source="cache")
+            return self._replay(cached)
+        if self.engine != "browser":
+            with m.timer("listing_seconds", engine="static"):
+                listing = await fetch_listing(self._session, base_url,
+                                              *((cached["etag"], cached["last_modified"]) if cached else ()))
+            if listing.not_modified:
+                m.inc("listings_total", source="304")
+                return self._replay(cached)
+            if not listing.needs_js or self.engine == "static":
+                m.inc("listings_total", source="static")
+                return listing
+        with m.timer("listing_seconds", engine="browser"):
+            links = await self._collect_browser(base_url)
+        m.inc("listings_total", source="browser")
+        return Listing(links)
+
+    async def _collect_retrying(self, base_url: str, trusted: bool = False) -> Listing:
+        """列目录出错按下载的重试策略退避重试；致命错误、重试用尽或已停止时抛出"""
+        for attempt in range(1, self._retry.attempts + 1):
+            try:
+                return await self._collect(base_url, trusted)
+            except (asyncio.CancelledError, KeyboardInterrupt):
+                raise
+            except Exception as e:
+                if classify(e) == FATAL or attempt >= self._retry.attempts:
+                    raise
+                self.metrics.inc("listing_retries_total", host=host_of(base_url))
+                if await self._sleep(self._retry.delay(attempt, e)):
+                    raise
+
+    def _replay(self, cached: dict) -> Listing:
+        """把索引里记下的子项类型/大小灌回元数据缓存，省掉 HEAD"""
+        links = {}
+        for h, (tail, is_dir, size) in cached["children"].items():
+            links[h] = tail
+            meta = self._meta.get(h)
+            meta.is_dir = is_dir
+            if size is not None:
+                meta.size, meta.size_exact = size, True
+        return Listing(links, etag=cached["etag"], last_modified=cached["last_modified"],
+                       not_modified=True)
+
+    async def _collect_browser(self, base_url: str):
+        hrefs = await self._open_browser().render(base_url)
+        return {urldefrag(urljoin(base_url, h))[0]: "" for h in hrefs}
+
+    def _open_browser(self) -> BrowserPool:
+        """按需创建页面池（每个扫描协程最多占一个 page）；浏览器在第一次渲染时才启动"""
+        if self._browser is None:
+            self._browser = BrowserPool(self.scan_workers)
+        return self._browser
+
+    async def _close_browser(self):
+        if self._own_browser and self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+
+    async def _scan(self, emit):
+        """
+        广度优先扫描：frontier 队列 + scan_workers 个协程并发列目录
+        发现的文件交给 emit（普通函数或协程函数）；已访问 URL 去重；stop() 后剩余目录直接跳过
+        """
+        frontier = asyncio.Queue()
+        seen = {self.url}
+        frontier.put_nowait((self.url, -1, False))     # 根目录层级记为 -1
+        self.scan_failed = []
+        root_error = []
+        self._filter = PathFilter(self.white, self.black, self.ext, self.download_html)
+        prog = self.progress
+        prog.dirs_done, prog.dirs_total = 0, 1
+
+        async def _worker():
+            while True:
+                url, cur_depth, trusted = await frontier.get()
                 try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.head(h) as resp:
-                            content_type = resp.headers.get('Content-Type', '')
-                            is_dir = 'text/html' in content_type and not h.endswith(('.html', '.htm'))
-                except:
-                    is_dir = h.endswith('/')
-                
-                if is_dir:  # 是目录则递归
-                    await self._gather(page, h, cur_depth + 1)
-                elif self._allowed(h):  # 是文件且符合扩展名要求
-                    if not self.download_html and pathlib.Path(h).suffix.lower() in {".html", ".htm"}:
-                        continue
-                    self._file_links.append({"url": h, "name": pathlib.Path(h).name, "size": 0})
+                    if not self._to_stop.is_set():
+                        sub_dirs, unchanged = await self._gather(url, cur_depth, trusted, emit)
+                        trusted = unchanged and not self.revalidate_subdirs
+                        for d in sub_dirs:
+                            key = d.rstrip("/")
+                            if key in seen:
+                                continue
+                            seen.add(key)
+                            frontier.put_nowait((d, cur_depth + 1, trusted))
+                            prog.dirs_total += 1
+                except (asyncio.CancelledError, KeyboardInterrupt):
+                    raise
+                except Exception as e:          # 重试后仍失败：记下目录，子树跳过；根目录失败则整体失败
+                    self.metrics.error("scan", url, e)
+                    self.scan_failed.append(url)
+                    if url == self.url:
+                        root_error.append(e)
+                finally:
+                    prog.dirs_done += 1
+                    frontier.task_done()
+
+        with self._phase(SCAN):
+            workers = [asyncio.create_task(_worker()) for _ in range(self.scan_workers)]
+            joined = asyncio.create_task(frontier.join())
+            stopped = asyncio.create_task(self._to_stop.wait())
+            try:
+                await asyncio.wait({joined, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for t in (*workers, joined, stopped):
+                    t.cancel()
+                await asyncio.gather(*workers, joined, stopped, return_exceptions=True)
+        if root_error:
+            raise root_error[0]
+
+    async def _gather(self, base_url: str, cur_depth: int, trusted: bool = False, emit=None):
+        """
+        列出 base_url 一层：文件交给 emit（默认写入 self._file_links）
+        返回 (需继续扫描的子目录, 该目录页是否未变化)
+        """
+        netloc = urlparse(self.url).netloc
+        listing = await self._collect_retrying(base_url, trusted)
+        sub_dirs, children = [], {}
+        for h, tail in listing.links.items():
+            u = urlparse(h)
+            if u.netloc != netloc or self._depth(u.path) != cur_depth + 1:
+                continue
+            rel = self._rel_path(h)
+            # 分片层以下不归自己的直接跳过，连类型都不用判断（校验清单除外，本片文件可能要用）
+            if self._shard is not None and not is_manifest(h) and not self._shard.owns(rel):
+                continue
+            meta = await self._classify(h, tail)
+            size = meta.size if meta.size_exact else None
+            children[h] = [tail, bool(meta.is_dir), size]
+            if meta.is_dir:  # 是目录则入队（不超过 depth，黑名单覆盖的整棵子树剪掉）
+                if cur_depth + 1 <= self.depth and (self._shard is None or self._shard.owns(rel, True)):
+                    rel = rel.rstrip("/") + "/"
+                    if self._filter.allow_dir(rel):
+                        sub_dirs.append(h)
+                    else:
+                        self.excluded.append(sys.intern(rel))
+                continue
+            if is_manifest(h):  # 校验清单不受过滤影响，单独记下
+                self._manifests.add(h)
+            # 文件的类型/大小到这里都取出来了，元数据条目随即收掉（大目录树上每个文件都占一条）
+            hinted, last_modified = size or meta.size or None, meta.last_modified
+            self._meta.compact(h)
+            if self._shard is not None and not self._shard.owns(rel, False):
+                continue
+            name = h.rpartition("/")[2]
+            if not self._filter.allow_type(name):  # 扩展名 / html
+                continue
+            mtime = parse_mtime(tail, last_modified) if self._filter.needs_mtime else None
+            if not self._filter.allow_file(name, rel, hinted, mtime):
+                self.excluded.append(sys.intern(name))
+                continue
+            if self.incremental or self._filter.needs_mtime:
+                self._tails[h] = tail
+            res = (emit or self._append_file)({"url": h, "name": name, "size": size or 0})
+            if asyncio.iscoroutine(res):
+                await res
+        if self.incremental and not listing.not_modified:
+            self._index.put_dir(base_url, listing.etag, listing.last_modified, children)
+        return sub_dirs, listing.not_modified
+
+    async def _classify(self, url: str, tail: str = ""):
+        """目录/文件判定：先看结尾 /、大小列、扩展名，判断不了才 HEAD（结果缓存）"""
+        meta = self._meta.hint(url, tail, self.ext)
+        if meta.is_dir is None:
+            meta = await self._meta.probe(self._session, url)
+            if meta.is_dir is None:
+                meta.is_dir = url.endswith("/")
+        return meta
+
+    def _sizes_from_journal(self, items: List[dict]):
+        """日志记为完成的文件：大小和 ETag/Last-Modified 用记录里的，下载时照样按日志零网络跳过"""
+        if not self._journal.path.exists():
+            return
+        todo = [it for it in items if it["size"] == 0]
+        if not todo:
+            return
+        try:
+            done = self._journal.open().done(it["url"] for it in todo)
+        finally:
+            self._journal.close()
+        for it in todo:
+            rec = done.get(it["url"])
+            if rec is not None and rec[0]:
+                self._meta.seed(it["url"], *rec)
+                it["size"] = rec[0]
+
+    async def _fill_sizes(self, items: List[dict]):
+        """并发补 size，已经 HEAD 过的直接用缓存"""
+        sem = asyncio.Semaphore(max(8, self.scan_workers * 2))
+
+        async def _one(it):
+            async with sem:
+                meta = await self._meta.probe(self._session, it["url"])
+                it["size"] = meta.size if meta.size_exact else 0    # 文件列表里的大小都是精确值
+                self._meta.compact(it["url"])
+
+        await asyncio.gather(*(_one(it) for it in items if it["size"] == 0))
 
     # ---------- 下载相关 ----------
     async def _download_all(self, max_workers: int, chunk_size: int):
-        conn = aiohttp.TCPConnector(limit=30)
+        # 两条车道分开排序、分开供货：大文件优先时小文件不会全排到最后，小文件车道一开始就有货
+        lanes = self._scheduler.split(self._file_links, self._rel_path)
+        await self._download_stream([aiter_list(lane) for lane in lanes], max_workers, chunk_size)
+
+    async def _download_stream(self, sources: List[AsyncIterator[dict]], max_workers: int, chunk_size: int):
+        """
+        固定 max_workers 个下载协程从有界队列取任务；队列满时不再从 sources 拉取（背压）
+        每个 source 一个供货协程，可以是现成列表，也可以是正在进行的 crawl()
+        """
         timeout = aiohttp.ClientTimeout(total=None, connect=30)
-        async with aiohttp.ClientSession(connector=conn, timeout=timeout) as session:
-            sem = asyncio.Semaphore(max_workers)
+        self._journal.open()
+        if self._cas is not None:
+            self._cas.open()
+            self._cas_linked = set()
+        self.progress.reset()
+        try:
+            async with self._client(max(30, max_workers * self._segments), timeout=timeout) as session:
+                if self._verify:
+                    await self._load_manifests(session)
+                job_urls: Set[str] = set()
+                later: List[dict] = []          # 主机熔断时放回的文件，本轮结束后再来
+                requeued: Dict[str, int] = {}
 
-            async def _bounded_dl(item):
-                async with sem:
-                    if self._to_stop.is_set():
-                        return
-                    url = item["url"]
-                    rel_path = unquote(urlparse(url).path).lstrip("/")
-                    prefix_path = urlparse(self.url).path.lstrip("/")
-                    if rel_path.startswith(prefix_path):
-                        rel_path = rel_path[len(prefix_path):].lstrip("/")
-                    local = self.store_dir / rel_path
-                    await self._dl_one(session, url, local, chunk_size)
-
-            tasks = [_bounded_dl(u) for u in self._file_links]
-            self._running_tasks = {asyncio.create_task(t) for t in tasks}
-            await tqdm_asyncio.gather(*self._running_tasks, desc="Files")
+                sched = self._scheduler
+                # 前 small_workers 个协程优先取小文件（只有一个协程时不分车道）
+                n_small = min(sched.small_workers, max_workers - 1)
 
-    async def _dl_one(self, session: aiohttp.ClientSession, url: str,
-                      local: pathlib.Path, chunk: int):
-        RETRY, BACKOFF = 10, 1
+                async def _round(*sources: AsyncIterator[dict]):
+                    todo = Lanes(sched, max_workers * 2)
+
+                    async def _feed(source: AsyncIterator[dict]):
+                        async for it in source:
+                            if self._to_stop.is_set():
+                                break
+                            # 转成 dict：之后各处记账都用同一个 url 字符串，不再各拼一份
+                            it = it if isinstance(it, dict) else dict(it)
+                            if it["url"] not in job_urls:
+                                job_urls.add(it["url"])
+                                self.progress.add(it["url"], it["name"], it["size"])
+                            await todo.put(it, sched.rank(it, self._rel_path(it["url"]))
+                                           if sched.reorders else ())
+
+                    async def _feed_all():
+                        try:
+                            await asyncio.gather(*(_feed(src) for src in sources))
+                        finally:
+                            await todo.close()
+
+                    async def _worker(small: bool):
+                        while True:
+                            item = await todo.get(small)
+                            if item is None:
+                                return
+                            url, t0 = item["url"], time.monotonic()
+                            try:
+                                if not self._to_stop.is_set():
+                                    wait = self._breakers.blocked(url)
+                                    if wait > 0:    # 不占名额，直接换下一个文件
+                                        raise CircuitOpen(host_of(url), wait)
+                                    await self._dl_bounded(session, url, chunk_size, item["size"])
+                            except CircuitOpen as e:
+                                if self._requeue(item, requeued, later, e):
+                                    continue
+                            if self.progress.settle(url, self._to_stop.is_set()) == FAILED:
+                                self.metrics.record(url, error="下载结束时没有给出结果")
+                            fp = self.progress.get(url)
+                            self.metrics.outcome(url, fp.state, bytes=fp.done,
+                                                 seconds=round(time.monotonic() - t0, 3))
+                            self._meta.forget(url)
+
+                    feeder = asyncio.create_task(_feed_all())
+                    workers = [asyncio.create_task(_worker(i < n_small)) for i in range(max_workers)]
+                    self._running_tasks = {feeder, *workers}
+                    try:
+                        await asyncio.gather(feeder, *workers)
+                    finally:
+                        for t in (feeder, *workers):
+                            t.cancel()
+                        await asyncio.gather(feeder, *workers, return_exceptions=True)
+
+                with self._phase(DOWNLOAD):
+                    await _round(*sources)
+                    # 熔断的主机冷却后再把它们的文件跑一轮，直到没有放回的或超过 requeue 次数
+                    while later and not self._to_stop.is_set():
+                        batch = later[:]
+                        later.clear()
+                        if await self._sleep(min(self._breakers.blocked(it["url"]) for it in batch)):
+                            break
+                        await _round(aiter_list(batch))
+                    for it in later:
+                        self.progress.settle(it["url"], True)
+                    if self._verify and not self._to_stop.is_set():
+                        await self._verify_rest(session, job_urls, chunk_size)
+        finally:
+            self._journal.close()
+            if self._cas is not None:
+                self._cas.close()
+
+    def _requeue(self, item: dict, requeued: Dict[str, int], later: List[dict], e: CircuitOpen) -> bool:
+        """主机熔断：文件放回队列；放回次数用完就记为失败（.part 和续传日志都保留）"""
+        url = item["url"]
+        n = requeued[url] = requeued.get(url, 0) + 1
+        if n <= self._retry.requeue:
+            later.append(item)
+            self.metrics.inc("requeued_total", host=e.host)
+            return True
+        self.metrics.error("circuit", url, e)
+        self.progress.finish(url, FAILED)
+        return False
+
+    async def _sleep(self, seconds: float) -> bool:
+        """可被 stop() 打断的等待；返回是否已停止"""
+        if seconds > 0:
+            try:
+                await asyncio.wait_for(self._to_stop.wait(), seconds)
+            except asyncio.TimeoutError:
+                pass
+        return self._to_stop.is_set()
+
+    async def _load_manifests(self, session: aiohttp.ClientSession):
+        """拉取还没读过的校验清单（都很小），失败忽略"""
+        for url in sorted(self._manifests - self._loaded_manifests):
+            self._loaded_manifests.add(url)
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+                    resp.raise_for_status()
+                    text = await resp.text(errors="replace")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.metrics.error("manifest", url, e)
+                continue
+            self._expected.update(parse_manifest(text, url))
+
+    def _expected_for(self, url: str):
+        """清单里这个文件的 (算法, hex)；没有为 None"""
+        return self._expected.get(url_key(url)) if self._expected else None
+
+    def _check(self, url: str):
+        """True/False 为比对结果；None 表示没有清单或没算对应摘要"""
+        expected = self._expected_for(url)
+        if expected is None:
+            return None
+        got = self.digests.get(url, {}).get(expected[0])
+        return None if got is None else got == expected[1]
+
+    async def _verify_rest(self, session: aiohttp.ClientSession, urls: Set[str], chunk: int):
+        """
+        收尾：下载期间才发现的清单、以及没有现成摘要的旧文件在这里比对
+        只有缺对应摘要的文件才回读磁盘
+        """
+        await self._load_manifests(session)
+        loop = asyncio.get_running_loop()
+        for url in urls:
+            expected = self._expected_for(url)
+            if expected is None:
+                continue
+            if self._to_stop.is_set():
+                return
+            algo, local = expected[0], self._local_path(url)
+            if url in self.verify_failed or not local.is_file():
+                continue
+            if self._check(url) is None:
+                hasher = await loop.run_in_executor(None, hash_file, local, [algo])
+                self.digests.setdefault(url, {}).update(hasher.hexdigests())
+            if self._check(url) is False:
+                try:
+                    await self._refetch(session, url, chunk)
+                except CircuitOpen as e:    # 收尾阶段不再排队等主机恢复
+                    self.metrics.error("verify", url, e)
+                    self.verify_failed.append(url)
+                    self.progress.finish(url, FAILED)
+
+    async def _refetch(self, session: aiohttp.ClientSession, url: str, chunk: int):
+        """摘要不符：删掉重下一次，仍不符就记为失败"""
+        self._local_path(url).unlink(missing_ok=True)
+        self._journal.forget(url)
+        self.digests.pop(url, None)
+        await self._dl_one(session, url, self._local_path(url), chunk)
+        if self._check(url) is False:
+            self.verify_failed.append(url)
+            self._journal.fail(url)
+            self.progress.finish(url, FAILED)
+            self.metrics.outcome(url, FAILED, error="checksum mismatch")
+        self._meta.forget(url)
+
+    async def _dl_bounded(self, session: aiohttp.ClientSession, url: str, chunk: int, size: int = 0):
+        """占用全局名额（多任务共享时）再下载；size 为文件列表里的大小（0 为未知）"""
+        if self._budget is None:
+            return await self._dl_host(session, url, chunk, size)
+        with self.metrics.timer("wait_seconds", stage="budget"):
+            await self._budget.acquire()
         try:
-            async with session.head(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-                if self._to_stop.is_set():
-                    return
-                resp.raise_for_status()
-                remote_size = int(resp.headers.get("content-length", 0))
-        except Exception:
+            await self._dl_host(session, url, chunk, size)
+        finally:
+            self._budget.release()
+
+    async def _dl_host(self, session: aiohttp.ClientSession, url: str, chunk: int, size: int = 0):
+        """占用该主机的一个并发名额再下载"""
+        if self._hosts is not None:
+            with self.metrics.timer("wait_seconds", stage="host"):
+                await self._hosts.acquire(url)
+        self.bandwidth.enter(url)
+        try:
+            await self._dl_one(session, url, self._local_path(url), chunk, size)
+            if self._verify and self._check(url) is False:
+                await self._refetch(session, url, chunk)
+            if self._cas is not None and self._check(url) is not False:
+                await self._cas_put(url)
+        finally:
+            self.bandwidth.leave(url)
+            if self._hosts is not None:
+                await self._hosts.release(url)
+
+    def _cas_digest(self, url: str, size: int = None):
+        """下载前预判内容摘要：校验清单里的 sha256 优先，其次同主机强 ETag + 大小的记录"""
+        expected = self._expected_for(url)
+        if expected is not None and expected[0] == ContentStore.ALGO:
+            return expected[1]
+        meta = self._meta.peek(url)
+        if meta is None or size is None:
+            return None
+        return self._cas.hint(urlparse(url).netloc, meta.etag, size)
+
+    async def _from_cas(self, url: str, local: pathlib.Path, remote_size: int = None) -> bool:
+        """内容已在去重库里就直接链接过来，不下载"""
+        digest = self._cas_digest(url, remote_size)
+        if digest is None:
+            return False
+        size = self._cas.size(digest)
+        if size is None or remote_size not in (None, size):
+            return False
+        safe_make_parent(local)
+        await asyncio.get_running_loop().run_in_executor(None, self._cas.materialize, digest, local)
+        self._cas_linked.add(url)
+        self.digests.setdefault(url, {})[ContentStore.ALGO] = digest
+        self._journal.finish(url, str(local), size, digests=self.digests[url])
+        self.progress.finish(url, SKIPPED)
+        self.metrics.record(url, skipped="dedup")
+        return True
+
+    async def _cas_put(self, url: str):
+        """下完（且校验通过）的文件入库；库里已有同内容则换成链接"""
+        digest = self.digests.get(url, {}).get(ContentStore.ALGO)
+        local = self._local_path(url)
+        if digest is None or url in self._cas_linked or not local.is_file():
             return
+        await asyncio.get_running_loop().run_in_executor(None, self._cas.put, local, digest)
+        self._cas_linked.add(url)
+        entry = self._journal.get(url)
+        if entry is not None:
+            self._cas.remember(urlparse(url).netloc, entry["etag"], entry["size"], digest)
 
-        if local.exists() and local.stat().st_size == remote_size:
+    async def _iter_body(self, resp: aiohttp.ClientResponse, url: str, chunk: int):
+        """读响应体；限速时读完一块先扣令牌，块大小随当前速率和活跃文件数调整"""
+        while True:
+            data = await resp.content.read(self.bandwidth.chunk_size(url, chunk))
+            if not data:
+                return
+            await self.bandwidth.take(url, len(data))
+            yield data
+
+    def _local_path(self, url: str) -> pathlib.Path:
+        return self.store_dir / self._rel_path(url)
+
+    async def _dl_one(self, session: aiohttp.ClientSession, url: str,
+                      local: pathlib.Path, chunk: int, size: int = 0):
+        m, host = self.metrics, host_of(url)
+        meta = self._meta.get(url)
+        remote_size = meta.size if meta.size_exact else (size or None)
+        entry = self._journal.get(url)
+        # 日志记为完成且本地文件还在 -> 零网络跳过
+        if entry is not None and entry["status"] == DONE:
+            if (local.exists() and local.stat().st_size == entry["size"]
+                    and remote_size in (None, entry["size"])):
+                if entry["digests"]:
+                    self.digests[url] = entry["digests"]
+                self.progress.finish(url, SKIPPED)
+                m.record(url, skipped="journal")
+                return
+            entry = None
+        # 没有日志的旧文件：大小与远端一致就直接登记为完成
+        if entry is None and remote_size is not None and local.exists() \
+                and local.stat().st_size == remote_size:
+            self._journal.finish(url, str(local), remote_size)
+            self.progress.finish(url, SKIPPED)
+            m.record(url, skipped="exists")
+            return
+        if self._cas is not None and await self._from_cas(url, local, remote_size):
             return
+        if self._scheduler.is_small(remote_size):
+            return await self._dl_small(session, url, local, chunk)
+        part = part_path(local)
+        if entry is not None and entry["status"] == PARTIAL and not part.exists() and local.exists():
+            os.replace(local, part)     # 旧版本直接写在正式文件名上的未完成文件
 
-        headers = {}
-        start_byte = 0
-        if local.exists():
-            start_byte = local.stat().st_size
-            headers["Range"] = f"bytes={start_byte}-"
-            mode = "ab"
-        else:
-            mode = "wb"
+        if self._segments > 1 and (remote_size is None or remote_size >= self._segment_min):
+            if await self._dl_segmented(session, url, local, chunk, entry):
+                return
+            entry = self._journal.get(url)
 
-        for attempt in range(1, RETRY + 1):
+        for attempt in range(1, self._retry.attempts + 1):
+            # 只信任日志里记下的偏移，之后的字节一律截掉重下（上次重试用尽记为失败的也接着下）
+            start_byte, headers = 0, {}
+            if entry is not None and entry["status"] != DONE and len(entry["ranges"]) == 1 \
+                    and part.exists():
+                start_byte = min(entry["ranges"][0][2], part.stat().st_size)
+            if start_byte:
+                headers["Range"] = f"bytes={start_byte}-"
+                validator = Journal.validator(entry)
+                if validator:
+                    headers["If-Range"] = validator
+            if self._hosts is not None:
+                with m.timer("wait_seconds", stage="throttle"):
+                    await self._hosts.ready(url)
+            self._breakers.check(url)   # 熔断中抛 CircuitOpen，由下载协程放回队列
+            m.record(url, attempts=attempt)
             try:
+                t0 = time.monotonic()
                 async with session.get(url, headers=headers,
                                        timeout=aiohttp.ClientTimeout(total=None, connect=30)) as resp:
+                    m.observe("response_seconds", time.monotonic() - t0, host=host)
+                    m.inc("requests_total", host=host, method="GET", status=resp.status)
                     if self._to_stop.is_set():
                         return
+                    if resp.status == 416:          # 记录的偏移已越界，马上从头来（不算主机出错）
+                        entry = None
+                        continue
+                    if self._hosts is not None:
+                        if resp.status in (429, 503):
+                            self._hosts.on_throttle(url, resp.status, resp.headers.get("Retry-After"))
+                        else:
+                            self._hosts.on_response(url, time.monotonic() - t0)
                     resp.raise_for_status()
-                    total = int(resp.headers.get("content-length", 0)) + start_byte
-                    pbar = tqdm(total=total, unit='B', unit_scale=True,
-                                desc=local.name, leave=False)
-                    pbar.update(start_byte)
+                    self._breakers.on_success(url)
+                    if start_byte and resp.status != 206:
+                        start_byte = 0              # 不支持 Range 或文件已变化，从头下载
+                    if resp.status == 200:
+                        meta.update_from_headers(resp.headers, url)
+                        # 响应头里的强 ETag + 大小命中去重库：不读响应体
+                        if self._cas is not None and meta.size_exact \
+                                and await self._from_cas(url, local, meta.size):
+                            return
+                    length = resp.headers.get("content-length")
+                    total = int(length) + start_byte if length is not None else None
+                    etag = resp.headers.get("ETag") or (entry or {}).get("etag")
+                    lm = resp.headers.get("Last-Modified") or (entry or {}).get("last_modified")
+                    self._journal.start(url, str(local), total, etag, lm, [[0, total, start_byte]])
+                    entry = self._journal.get(url)
 
+                    self.progress.start(url, total, start_byte)
                     safe_make_parent(local)
-                    async with aiofiles.open(local, mode) as f:
-                        async for data in resp.content.iter_chunked(chunk):
+                    hasher = Hasher(self._algos_for(url))
+                    loop = asyncio.get_running_loop()
+                    if start_byte:
+                        os.truncate(part, start_byte)
+                        if hasher:      # hashlib 状态无法持久化，续传时只回读已有的前缀
+                            hasher = await loop.run_in_executor(
+                                None, hash_file, part, self._algos_for(url), start_byte)
+                    else:
+                        part.unlink(missing_ok=True)
+                        if total:
+                            await loop.run_in_executor(None, preallocate, part, total)
+                    pos = mark = start_byte
+                    w = FileWriter(part, start_byte, self._write_buffer, self._durability)
+                    await w.open()
+                    # 读网络 / 写盘 / 摘要各自累加，文件结束时各记一次，不在每块上碰直方图
+                    t_read = t_write = t_hash = 0.0
+                    clock = time.perf_counter
+                    t = clock()
+                    try:
+                        async for data in self._iter_body(resp, url, chunk):
+                            t1 = clock()
+                            t_read += t1 - t
                             if self._to_stop.is_set():
-                                pbar.close()
                                 return
-                            await f.write(data)
-                            pbar.update(len(data))
-                    pbar.close()
+                            await w.write(data)
+                            t2 = clock()
+                            hasher.update(data)
+                            t = clock()
+                            t_write += t2 - t1
+                            t_hash += t - t2
+                            pos += len(data)
+                            self.progress.advance(url, len(data))
+                            if pos - mark >= SAVE_EVERY:
+                                mark = pos
+                                entry["ranges"][0][2] = await w.flush()
+                                self._journal.save_ranges(url, entry["ranges"])
+                                t = clock()
+                    finally:
+                        await w.close()
+                        entry["ranges"][0][2] = w.safe_offset   # 只记已经写盘的位置
+                        self._journal.save_ranges(url, entry["ranges"])
+                        m.inc("bytes_total", pos - start_byte, host=host)
+                        m.observe("transfer_seconds", t_read, stage="read")
+                        m.observe("transfer_seconds", t_write, stage="write")
+                        if hasher:
+                            m.observe("transfer_seconds", t_hash, stage="hash")
+                    if total is not None and pos != total:
+                        raise aiohttp.ClientPayloadError(f"short read {pos}/{total}")
+                    await loop.run_in_executor(None, commit, part, local, self._durability)
+                    if hasher:
+                        self.digests[url] = hasher.hexdigests()
+                    self._journal.finish(url, str(local), pos, digests=self.digests.get(url))
+                    self.progress.finish(url)
+                    if self._hosts is not None:
+                        self._hosts.on_success(url, pos - start_byte)
                     return
-            except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
-                if attempt < RETRY:
-                    await asyncio.sleep(BACKOFF)
-                else:
-                    local.unlink(missing_ok=True)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                if not await self._retry_or_fail(url, e, attempt):
+                    return
+        # 次数用完还没有结果（最后一次是 416）：同样记为失败
+        self.metrics.record(url, error="416 Range Not Satisfiable")
+        self._fail(url, RETRY)
+
+    async def _retry_or_fail(self, url: str, e: BaseException, attempt: int) -> bool:
+        """
+        下载出错：记指标、反馈给熔断器和自适应并发；可重试就退避后返回 True
+        致命错误或重试用尽记为失败（.part 和日志里的偏移都留着，下次运行续传）；停止时直接返回 False
+        """
+        m, host = self.metrics, host_of(url)
+        m.error("download", url, e)
+        kind = classify(e)
+        if isinstance(e, aiohttp.ClientResponseError) and kind == FATAL:
+            self._breakers.on_success(url)      # 主机正常，只是这个文件不行
+        elif kind == RETRY and self._breakers.on_failure(url, retry_after(e)):
+            m.inc("circuit_trips_total", host=host)
+        if self._hosts is not None and not (
+                isinstance(e, aiohttp.ClientResponseError) and e.status in (429, 503)):
+            self._hosts.on_error(url, type(e).__name__)
+        if kind == RETRY and attempt < self._retry.attempts:
+            m.inc("retries_total", host=host)
+            return not await self._sleep(self._retry.delay(attempt, e))
+        self._fail(url, kind)
+        return False
+
+    def _fail(self, url: str, kind: str):
+        """记为失败；.part 和日志里的偏移都留着，下次运行续传"""
+        self.metrics.record(url, error_class=kind)
+        self._journal.fail(url)
+        self.progress.finish(url, FAILED)
+
+    async def _dl_small(self, session: aiohttp.ClientSession, url: str,
+                        local: pathlib.Path, chunk: int):
+        """
+        小文件车道：不 HEAD、不预分配、不记续传偏移，响应体读进内存后一个线程池任务写完改名，
+        日志批量提交；连接靠连接池 keep-alive 复用，一个接一个背靠背下
+        """
+        m, host = self.metrics, host_of(url)
+        meta = self._meta.get(url)
+        loop = asyncio.get_running_loop()
+        for attempt in range(1, self._retry.attempts + 1):
+            if self._hosts is not None:
+                with m.timer("wait_seconds", stage="throttle"):
+                    await self._hosts.ready(url)
+            self._breakers.check(url)
+            m.record(url, attempts=attempt, lane="small")
+            try:
+                t0 = time.monotonic()
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=None, connect=30)) as resp:
+                    m.observe("response_seconds", time.monotonic() - t0, host=host)
+                    m.inc("requests_total", host=host, method="GET", status=resp.status)
+                    if self._to_stop.is_set():
+                        return
+                    if self._hosts is not None:
+                        if resp.status in (429, 503):
+                            self._hosts.on_throttle(url, resp.status, resp.headers.get("Retry-After"))
+                        else:
+                            self._hosts.on_response(url, time.monotonic() - t0)
+                    resp.raise_for_status()
+                    self._breakers.on_success(url)
+                    meta.update_from_headers(resp.headers, url)
+                    if self._cas is not None and meta.size_exact \
+                            and await self._from_cas(url, local, meta.size):
+                        return
+                    length = resp.headers.get("content-length")
+                    self.progress.start(url, int(length) if length is not None else None)
+                    buf = bytearray()
+                    async for data in self._iter_body(resp, url, chunk):
+                        if self._to_stop.is_set():
+                            return
+                        buf += data
+                        self.progress.advance(url, len(data))
+                    m.inc("bytes_total", len(buf), host=host)
+                    if length is not None and len(buf) != int(length):
+                        raise aiohttp.ClientPayloadError(f"short read {len(buf)}/{length}")
+                algos = self._algos_for(url)
+                if algos:
+                    hasher = Hasher(algos)
+                    hasher.update(buf)
+                    self.digests[url] = hasher.hexdigests()
+                safe_make_parent(local)
+                await loop.run_in_executor(None, write_file, part_path(local), local, buf, self._durability)
+                self._journal.finish(url, str(local), len(buf), meta.etag, meta.last_modified,
+                                     digests=self.digests.get(url), commit=False)
+                self.progress.finish(url)
+                if self._hosts is not None:
+                    self._hosts.on_success(url, len(buf))
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                if not await self._retry_or_fail(url, e, attempt):
+                    return
+
+    async def _dl_segmented(self, session: aiohttp.ClientSession, url: str,
+                            local: pathlib.Path, chunk: int, entry: dict = None) -> bool:
+        """分段下载；返回 False 表示不适用，调用方走单连接"""
+        meta = self._meta.get(url)
+        if meta.accept_ranges is None or not meta.size_exact:
+            meta = await self._meta.probe(session, url)
+        if not meta.accept_ranges or not meta.size_exact or meta.size < self._segment_min:
+            return False
+        if self._cas is not None and await self._from_cas(url, local, meta.size):
+            return True
+        size, part = meta.size, part_path(local)
+        loop = asyncio.get_running_loop()
+        # 日志里有同版本、同大小的分段记录就按段续传，否则重新预分配
+        if (entry is not None and entry["status"] != DONE and entry["size"] == size
+                and len(entry["ranges"]) > 1 and part.exists() and part.stat().st_size == size
+                and (entry["etag"] or None) == (meta.etag or None)):
+            ranges = entry["ranges"]
+        else:
+            safe_make_parent(local)
+            part.unlink(missing_ok=True)
+            await loop.run_in_executor(None, preallocate, part, size)
+            ranges = split(size, self._segments)
+            self._journal.start(url, str(local), size, meta.etag, meta.last_modified, ranges)
+            entry = self._journal.get(url)
+        have = sum(pos - start for start, _, pos in ranges)
+        self.progress.start(url, size, have)
+        self._breakers.check(url)
+        try:
+            ok = await download_segmented(session, url, part, ranges, chunk, self._to_stop,
+                                          lambda r: self._journal.save_ranges(url, r),
+                                          advance=lambda n: self.progress.advance(url, n),
+                                          validator=Journal.validator(entry),
+                                          body=lambda resp: self._iter_body(resp, url, chunk),
+                                          buffer=self._write_buffer, durability=self._durability,
+                                          policy=self._retry,
+                                          on_error=lambda e: self.metrics.error("segment", url, e))
+            self.metrics.record(url, segments=len(ranges))
+            self.metrics.inc("bytes_total", self.progress.get(url).done - have, host=host_of(url))
+            if ok:
+                self._breakers.on_success(url)
+                # 各段乱序到达，摘要只能完成后顺序读一遍
+                algos = self._algos_for(url)
+                if algos:
+                    with self.metrics.timer("transfer_seconds", stage="hash"):
+                        hasher = await loop.run_in_executor(None, hash_file, part, algos)
+                    self.digests[url] = hasher.hexdigests()
+                await loop.run_in_executor(None, commit, part, local, self._durability)
+                self._journal.finish(url, str(local), size, digests=self.digests.get(url))
+                self.progress.finish(url)
+                if self._hosts is not None:
+                    self._hosts.on_success(url, size)
+            elif not self._to_stop.is_set():
+                if self._breakers.on_failure(url):
+                    self.metrics.inc("circuit_trips_total", host=host_of(url))
+                self.progress.finish(url, FAILED)
+            return True
+        except RangeUnsupported:
+            part.unlink(missing_ok=True)
+            self._journal.forget(url)
+            return False
+
+    def _algos_for(self, url: str) -> Set[str]:
+        algos = set(self._digest_algos)
+        if self._cas is not None:
+            algos.add(ContentStore.ALGO)
+        expected = self._expected_for(url) if self._verify else None
+        if expected is not None:
+            algos.add(expected[0])
+        return algos
 
     async def _cancel_all(self):
         """取消所有正在运行的任务"""
         for t in self._running_tasks:
             t.cancel()
-        try:
+        if self._running_tasks:
             await asyncio.wait(self._running_tasks, timeout=0.1)
-        except asyncio.TimeoutError:
-            pass
         self._running_tasks.clear()
-        self._file_links = []  # 清空文件链接列表
+        self._file_links = FileList()  # 清空文件链接列表
 
 
 # ---------- 工具 ----------
+async def aiter_list(items) -> AsyncIterator[dict]:
+    for it in items:
+        yield it
+
+
 def safe_make_parent(path: pathlib.Path):
     parent = path.parent
     if parent.is_file():
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+黑白名单 / 扩展名过滤，预编译成一个匹配器
+每条规则的写法：
+  abc             文件名包含 abc
+  *.iso / a?c     通配符，匹配整个文件名
+  drivers/*/old/* 含 / 的按相对根目录的路径匹配；黑名单里能匹配到目录的，扫描时整个子树不再下钻
+  re:^v\\d+       正则（search），同样含 / 的按路径匹配
+  size>100M       大小条件，支持 > >= < <= =，单位 K/M/G/T
+  mtime<2024-01-01  日期条件（列表页日期列或 Last-Modified，按 UTC）
+同一个名单内任意一条命中即算命中；黑名单优先
+名字、通配符、路径和正则规则一律不分大小写（*.ZIP 也匹配 a.zip）
+"""
+import calendar, fnmatch, operator, re, time
+from typing import Iterable, List, Optional, Tuple
+
+from .meta import parse_size_arg
+
+_OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+        "=": operator.eq, "==": operator.eq}
+_PRED_RE = re.compile(r"^(size|mtime)\s*(>=|<=|==|>|<|=)\s*(.+)$", re.I)
+_GLOB_CHARS = set("*?[")
+
+
+def _parse_date(text: str) -> float:
+    text = text.strip()
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return float(calendar.timegm(time.strptime(text, fmt)))
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析日期: {text}")
+
+
+class Matcher:
+    """一个名单编译后的结果：文件名正则、路径正则、条件列表各一份"""
+    __slots__ = ("name_re", "path_re", "preds")
+
+    def __init__(self, patterns: Iterable[str]):
+        names, paths = [], []
+        self.preds: List[Tuple[str, callable, float]] = []
+        for raw in patterns:
+            p = raw.strip()
+            if not p:
+                continue
+            m = _PRED_RE.match(p)
+            if m:
+                field, op, value = m.group(1).lower(), m.group(2), m.group(3)
+                value = parse_size_arg(value) if field == "size" else _parse_date(value)
+                self.preds.append((field, _OPS[op], value))
+                continue
+            if p.startswith("re:"):
+                rx = p[3:]
+                re.compile(rx)              # 规则写错尽早报出来
+            elif _GLOB_CHARS & set(p):
+                rx = "^" + fnmatch.translate(p.lstrip("/"))
+            else:
+                rx = re.escape(p)
+            (paths if "/" in p[3 if p.startswith("re:") else 0:] else names).append(rx)
+        self.name_re = re.compile("|".join(f"(?:{r})" for r in names), re.I) if names else None
+        self.path_re = re.compile("|".join(f"(?:{r})" for r in paths), re.I) if paths else None
+
+    def __bool__(self):
+        return bool(self.name_re or self.path_re or self.preds)
+
+    def match(self, name: str, path: str, size: int = None, mtime: float = None) -> Optional[bool]:
+        """命中 True，不命中 False；只剩条件规则且所需信息未知时返回 None"""
+        if self.name_re is not None and self.name_re.search(name):
+            return True
+        if self.path_re is not None and self.path_re.search(path):
+            return True
+        unknown = False
+        for field, op, value in self.preds:
+            got = size if field == "size" else mtime
+            if got is None:
+                unknown = True
+            elif op(got, value):
+                return True
+        return None if unknown else False
+
+    def match_dir(self, path: str) -> bool:
+        """目录（path 以 / 结尾）是否被路径规则整个覆盖"""
+        return self.path_re is not None and bool(self.path_re.search(path))
+
+
+class PathFilter:
+    """
+    allow_file / allow_dir 在扫描时调用；被排除的名字记进 excluded
+    大小/日期条件在信息未知时先放行，拿到大小后再调 recheck()
+    """
+
+    def __init__(self, white: Iterable[str] = (), black: Iterable[str] = (),
+                 ext: Iterable[str] = (), download_html: bool = False):
+        self.white, self.black = Matcher(white), Matcher(black)
+        self.ext = tuple(e.lower() for e in ext or ())
+        self.skip = () if download_html else (".html", ".htm")
+        self.needs_size = any(f == "size" for f, _, _ in self.white.preds + self.black.preds)
+        self.needs_mtime = any(f == "mtime" for f, _, _ in self.white.preds + self.black.preds)
+
+    def allow_type(self, name: str) -> bool:
+        """扩展名过滤（不计入 excluded，和以前一样）"""
+        low = name.lower()
+        if self.ext and not low.endswith(self.ext):
+            return False
+        return not (self.skip and low.endswith(self.skip))
+
+    def allow_file(self, name: str, path: str, size: int = None, mtime: float = None) -> bool:
+        if self.black.match(name, path, size, mtime) is True:
+            return False
+        return not self.white or self.white.match(name, path, size, mtime) is not False
+
+    def allow_dir(self, path: str) -> bool:
+        """黑名单的路径规则覆盖了这个目录就不再下钻；白名单无法预知子树内容，不剪枝"""
+        return not self.black.match_dir(path)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量爬取索引（与续传日志同一个 store_dir/.batchdownload.db）
+dirs:  每个目录页的 ETag/Last-Modified 和子链接，下次用条件请求，304 直接复用
+files: 上次 fetch() 的结果，用来算新增/变化/删除
+"""
+import json, pathlib, sqlite3, time
+from typing import Dict, Optional, Tuple
+
+from .journal import Journal
+
+
+class CrawlIndex:
+    COMMIT_EVERY = 1.0
+
+    def __init__(self, store_dir, name: str = None):
+        self.path = pathlib.Path(store_dir) / (name or Journal.NAME)
+        self._db: Optional[sqlite3.Connection] = None
+        self._last_commit = 0.0
+
+    def open(self) -> "CrawlIndex":
+        if self._db is not None:
+            return self
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path))
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS dirs("
+            " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, children TEXT, updated REAL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS crawl_files("
+            " url TEXT PRIMARY KEY, size INTEGER, sig TEXT)")
+        self._db.commit()
+        return self
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    # ---------- 目录 ----------
+    def get_dir(self, url: str) -> Optional[dict]:
+        row = self._db.execute(
+            "SELECT etag, last_modified, children FROM dirs WHERE url=?", (url,)).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "children": json.loads(row[2])}
+
+    def put_dir(self, url: str, etag: Optional[str], last_modified: Optional[str],
+                children: Dict[str, str]):
+        self._db.execute("INSERT OR REPLACE INTO dirs VALUES (?,?,?,?,?)",
+                         (url, etag, last_modified, json.dumps(children), time.time()))
+        now = time.monotonic()
+        if now - self._last_commit >= self.COMMIT_EVERY:
+            self._db.commit()
+            self._last_commit = now
+
+    # ---------- 文件快照 ----------
+    def files_under(self, prefix: str) -> Dict[str, Tuple[int, str]]:
+        rows = self._db.execute(
+            "SELECT url, size, sig FROM crawl_files WHERE substr(url, 1, ?)=?",
+            (len(prefix), prefix))
+        return {u: (size, sig) for u, size, sig in rows}
+
+    def replace_files(self, prefix: str, files: Dict[str, Tuple[int, str]]):
+        self._db.execute("DELETE FROM crawl_files WHERE substr(url, 1, ?)=?", (len(prefix), prefix))
+        self._db.executemany("INSERT INTO crawl_files VALUES (?,?,?)",
+                             ((u, size, sig) for u, (size, sig) in files.items()))
+        self._db.commit()
+
+    @staticmethod
+    def diff(old: Dict[str, Tuple[int, str]], new: Dict[str, Tuple[int, str]]):
+        """返回 (新增, 变化, 删除) 三个 URL 列表"""
+        added = [u for u in new if u not in old]
+        changed = [u for u in new if u in old and old[u] != new[u]]
+        removed = [u for u in old if u not in new]
+        return added, changed, removed
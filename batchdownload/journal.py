@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+断点续传日志（store_dir/.batchdownload.db，SQLite WAL）
+每个文件记录 URL、ETag/Last-Modified、预期大小、已完成字节区间和最终状态
+只有已经 flush 的字节才会记进区间，重启后按记录的偏移续传，之后的字节一律不信任
+"""
+import json, pathlib, sqlite3, time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PARTIAL, DONE, FAILED = "partial", "done", "failed"
+
+
+class Journal:
+    NAME = ".batchdownload.db"
+    COMMIT_EVERY = 1.0              # 秒；进程被杀最多丢这么久的进度（数据本身不丢）
+
+    def __init__(self, store_dir, name: str = None):
+        self.path = pathlib.Path(store_dir) / (name or self.NAME)
+        self._db: Optional[sqlite3.Connection] = None
+        self._last_commit = 0.0
+
+    def open(self) -> "Journal":
+        if self._db is not None:
+            return self
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path))
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files("
+            " url TEXT PRIMARY KEY, path TEXT, size INTEGER, etag TEXT,"
+            " last_modified TEXT, ranges TEXT, status TEXT, updated REAL, digests TEXT)"
+        )
+        cols = {row[1] for row in self._db.execute("PRAGMA table_info(files)")}
+        if "digests" not in cols:           # 旧版日志补列
+            self._db.execute("ALTER TABLE files ADD COLUMN digests TEXT")
+        self._db.commit()
+        return self
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    # ---------- 查询 ----------
+    def get(self, url: str) -> Optional[dict]:
+        row = self._db.execute(
+            "SELECT url, path, size, etag, last_modified, ranges, status, digests"
+            " FROM files WHERE url=?", (url,)).fetchone()
+        if row is None:
+            return None
+        keys = ("url", "path", "size", "etag", "last_modified", "ranges", "status", "digests")
+        entry = dict(zip(keys, row))
+        entry["ranges"] = json.loads(entry["ranges"]) if entry["ranges"] else []
+        entry["digests"] = json.loads(entry["digests"]) if entry["digests"] else {}
+        return entry
+
+    def done(self, urls: Iterable[str], batch: int = 500) -> Dict[str, Tuple[int, Optional[str], Optional[str]]]:
+        """urls 里已完成的：url -> (大小, ETag, Last-Modified)，分批查询"""
+        urls, out = list(urls), {}
+        for i in range(0, len(urls), batch):
+            part = urls[i:i + batch]
+            rows = self._db.execute(
+                f"SELECT url, size, etag, last_modified FROM files"
+                f" WHERE status=? AND url IN ({','.join('?' * len(part))})", (DONE, *part))
+            for url, size, etag, lm in rows:
+                out[url] = (size, etag, lm)
+        return out
+
+    @staticmethod
+    def validator(entry: dict) -> Optional[str]:
+        """If-Range 用：强 ETag 优先，其次 Last-Modified"""
+        etag = entry.get("etag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return entry.get("last_modified")
+
+    # ---------- 写入 ----------
+    def start(self, url: str, path: str, size: Optional[int], etag: Optional[str],
+              last_modified: Optional[str], ranges: List[List[int]]):
+        self._db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,NULL)",
+            (url, path, size, etag, last_modified, json.dumps(ranges), PARTIAL, time.time()))
+        self._db.commit()
+
+    def save_ranges(self, url: str, ranges: List[List[int]]):
+        """ranges 里的偏移必须已经 flush 到文件"""
+        self._db.execute("UPDATE files SET ranges=?, updated=? WHERE url=?",
+                         (json.dumps(ranges), time.time(), url))
+        self._maybe_commit()
+
+    def finish(self, url: str, path: str, size: int, etag: str = None, last_modified: str = None,
+               digests: dict = None, commit: bool = True):
+        """commit=False 时和进度一样攒着提交（小文件批量完成，丢了也只是重下）"""
+        self._db.execute(
+            "INSERT INTO files VALUES (?,?,?,?,?,NULL,?,?,?) ON CONFLICT(url) DO UPDATE SET"
+            " path=excluded.path, size=excluded.size, status=excluded.status, ranges=NULL,"
+            " etag=COALESCE(excluded.etag, etag),"
+            " last_modified=COALESCE(excluded.last_modified, last_modified),"
+            " digests=excluded.digests, updated=excluded.updated",
+            (url, path, size, etag, last_modified, DONE, time.time(),
+             json.dumps(digests) if digests else None))
+        if commit:
+            self._db.commit()
+        else:
+            self._maybe_commit()
+
+    def fail(self, url: str):
+        self._db.execute("UPDATE files SET status=?, updated=? WHERE url=?",
+                         (FAILED, time.time(), url))
+        self._db.commit()
+
+    def forget(self, url: str):
+        self._db.execute("DELETE FROM files WHERE url=?", (url,))
+        self._db.commit()
+
+    def _maybe_commit(self):
+        now = time.monotonic()
+        if now - self._last_commit >= self.COMMIT_EVERY:
+            self._db.commit()
+            self._last_commit = now
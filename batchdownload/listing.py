@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+无浏览器目录列表解析
+aiohttp 拉取页面 + html.parser 流式提取 a[href]，适用于 Apache/nginx/lighttpd 等静态 autoindex
+"""
+import codecs
+from html.parser import HTMLParser
+from typing import Dict, List
+from urllib.parse import urljoin, urldefrag
+
+import aiohttp
+
+SKIP_SCHEMES = ("javascript:", "mailto:", "data:", "tel:")
+
+
+class LinkParser(HTMLParser):
+    """
+    边喂边解析，只记录 <a href>、<base href> 和 <script> 数量
+    顺带保留每个链接之后同一行/同一 <tr> 的文本（autoindex 的日期、大小列）
+    """
+    TAIL_MAX = 200
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs: List[str] = []
+        self.tails: List[str] = []
+        self.base = None
+        self.scripts = 0
+        self.noscript = False
+        self._in_a = False
+        self._open = None           # 正在收集尾随文本的链接下标
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            self._open = None
+            if href and not href.lower().startswith(SKIP_SCHEMES):
+                self.hrefs.append(href.strip())
+                self.tails.append("")
+                self._open = len(self.hrefs) - 1
+            self._in_a = True
+        elif tag in ("tr", "li", "table"):
+            self._open = None
+        elif tag == "td" and self._open is not None:
+            self.tails[self._open] += " "
+        elif tag == "base" and self.base is None:
+            self.base = dict(attrs).get("href")
+        elif tag == "script":
+            self.scripts += 1
+        elif tag == "noscript":
+            self.noscript = True
+
+    def handle_endtag(self, tag):
+        if tag == "a":
+            self._in_a = False
+        elif tag in ("tr", "li", "table"):
+            self._open = None
+
+    def handle_data(self, data):
+        if self._open is None or self._in_a:
+            return
+        tail = self.tails[self._open]
+        if len(tail) < self.TAIL_MAX:
+            self.tails[self._open] = tail + data
+
+    def needs_js(self) -> bool:
+        """没拿到任何链接却带脚本，或 <noscript> 提示，基本就是前端渲染的页面"""
+        if self.hrefs:
+            return self.noscript and len(self.hrefs) <= 1
+        return self.scripts > 0 or self.noscript
+
+
+class Listing:
+    """一次目录页请求的结果；not_modified 为 True 时 links 为空，应复用缓存"""
+    __slots__ = ("links", "needs_js", "etag", "last_modified", "not_modified")
+
+    def __init__(self, links=None, needs_js=False, etag=None, last_modified=None,
+                 not_modified=False):
+        self.links: Dict[str, str] = links or {}
+        self.needs_js = needs_js
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+
+
+async def fetch_listing(session: aiohttp.ClientSession, url: str,
+                        etag: str = None, last_modified: str = None,
+                        chunk: int = 64 * 1024) -> Listing:
+    """
+    拉取并解析一个目录页，links 为 {绝对链接: 尾随文本}
+    传入上次的 etag/last_modified 时发条件请求，304 返回 not_modified
+    非 HTML 响应视为空目录
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    parser = LinkParser()
+    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+        if resp.status == 304:
+            return Listing(etag=etag, last_modified=last_modified, not_modified=True)
+        resp.raise_for_status()
+        if "html" not in resp.headers.get("Content-Type", "").lower():
+            return Listing()
+        try:
+            decoder = codecs.getincrementaldecoder(resp.charset or "utf-8")(errors="replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        async for data in resp.content.iter_chunked(chunk):
+            parser.feed(decoder.decode(data))
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+        base = str(resp.url)            # 以重定向后的地址为准，/dir -> /dir/
+        validators = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+    if parser.base:
+        base = urljoin(base, parser.base)
+    links: Dict[str, str] = {}
+    for h, tail in zip(parser.hrefs, parser.tails):
+        link = urldefrag(urljoin(base, h))[0]
+        if len(tail.strip()) >= len(links.get(link, "").strip()):
+            links[link] = tail      # 同一地址多个 <a>（图标 + 名称）取信息最多的
+    return Listing(links, parser.needs_js(), *validators)
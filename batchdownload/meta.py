@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+URL 元数据缓存
+每个 URL 最多 HEAD 一次，目录判定 / 补 size / 下载 共用同一份结果
+列表页已经能说明问题时（结尾 /、autoindex 大小列、常见扩展名）直接跳过 HEAD
+"""
+import asyncio, calendar, posixpath, re, time
+from email.utils import parsedate_tz, mktime_tz
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+from .metrics import Metrics, host_of
+
+# 出现这些扩展名基本可以确定是文件
+FILE_EXTS = {
+    ".7z", ".apk", ".appimage", ".bin", ".bz2", ".cab", ".crt", ".csv", ".deb", ".dll",
+    ".dmg", ".doc", ".docx", ".drv", ".efi", ".exe", ".flac", ".gif", ".gz", ".img",
+    ".inf", ".iso", ".jar", ".jpeg", ".jpg", ".json", ".lz", ".lzma", ".md5", ".mp3",
+    ".mp4", ".msi", ".msu", ".ova", ".pdf", ".pkg", ".png", ".ppt", ".pptx", ".qcow2",
+    ".rar", ".rpm", ".run", ".sha1", ".sha256", ".sh", ".sig", ".sys", ".tar", ".tgz",
+    ".txt", ".vhd", ".vhdx", ".vmdk", ".whl", ".xls", ".xlsx", ".xml", ".xz", ".zip", ".zst",
+}
+# autoindex 大小列：nginx 给字节数，Apache/lighttpd 给 1.2K / 3M 之类，目录是 "-"
+_SIZE_RE = re.compile(r"(?:^|\s)(-|\d+(?:\.\d+)?)([KMGT]i?B?)?\s*$", re.I)
+_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+# autoindex 日期列：nginx "01-Jan-2024 10:00"，Apache/lighttpd "2024-01-01 10:00" / "2024-Jan-01 10:00:00"
+_MONTHS = {m.lower(): i for i, m in enumerate(calendar.month_abbr) if m}
+_DATE_RES = (
+    re.compile(r"(?P<d>\d{1,2})-(?P<mon>[A-Za-z]{3})-(?P<y>\d{4})(?:\s+(?P<H>\d{1,2}):(?P<M>\d{2}))?"),
+    re.compile(r"(?P<y>\d{4})-(?P<mon>[A-Za-z]{3}|\d{1,2})-(?P<d>\d{1,2})(?:[\sT]+(?P<H>\d{1,2}):(?P<M>\d{2}))?"),
+)
+
+
+class UrlMeta:
+    """单个 URL 的已知信息；None 表示未知"""
+    __slots__ = ("is_dir", "size", "size_exact", "ctype", "etag",
+                 "last_modified", "accept_ranges", "probed")
+
+    def __init__(self):
+        self.is_dir: Optional[bool] = None
+        self.size: Optional[int] = None
+        self.size_exact = False
+        self.ctype: Optional[str] = None
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.accept_ranges: Optional[bool] = None
+        self.probed = False
+
+    def update_from_headers(self, headers, url: str = ""):
+        self.ctype = headers.get("Content-Type", self.ctype)
+        if "Content-Length" in headers:
+            self.size = int(headers["Content-Length"])
+            self.size_exact = True
+        self.etag = headers.get("ETag", self.etag)
+        self.last_modified = headers.get("Last-Modified", self.last_modified)
+        if "Accept-Ranges" in headers:
+            self.accept_ranges = headers["Accept-Ranges"].lower() == "bytes"
+        if self.ctype is not None and self.is_dir is None:
+            self.is_dir = "text/html" in self.ctype and not url.endswith((".html", ".htm"))
+
+
+def parse_size(tail: str):
+    """
+    解析链接后面的 autoindex 文本
+    返回 (is_dir, size, exact)；认不出返回 (None, None, False)
+    """
+    m = _SIZE_RE.search(tail or "")
+    if not m:
+        return None, None, False
+    num, unit = m.groups()
+    if num == "-":
+        return True, None, False
+    if unit:
+        return False, int(float(num) * _UNITS[unit[0].upper()]), False
+    if "." in num:
+        return None, None, False
+    return False, int(num), True
+
+
+def parse_size_arg(text: str) -> int:
+    """用户写的大小（命令行参数、规则里的 size>100M）：100、1.5M、2GiB -> 字节数"""
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMGT]i?B?)?", text.strip(), re.I)
+    if not m:
+        raise ValueError(f"无法解析大小: {text}")
+    num, unit = m.groups()
+    return int(float(num) * (_UNITS[unit[0].upper()] if unit else 1))
+
+
+def parse_mtime(tail: str = "", last_modified: str = None) -> Optional[float]:
+    """列表文本里的日期（按 UTC），没有再用 Last-Modified；都没有返回 None"""
+    for rx in _DATE_RES:
+        m = rx.search(tail or "")
+        if m:
+            mon = m.group("mon")
+            mon = _MONTHS.get(mon.lower()) if mon.isalpha() else int(mon)
+            if not mon:
+                continue
+            return float(calendar.timegm((int(m.group("y")), mon, int(m.group("d")),
+                                          int(m.group("H") or 0), int(m.group("M") or 0), 0)))
+    if last_modified:
+        parsed = parsedate_tz(last_modified)
+        if parsed is not None:
+            return float(mktime_tz(parsed))
+    return None
+
+
+class MetaCache:
+    """url -> UrlMeta，HEAD 结果只取一次，并发的重复请求合并为一个"""
+
+    def __init__(self, metrics: Metrics = None):
+        self._data: Dict[str, UrlMeta] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.probes = 0             # 实际发出的 HEAD 数
+        self.metrics = metrics
+
+    def get(self, url: str) -> UrlMeta:
+        meta = self._data.get(url)
+        if meta is None:
+            meta = self._data[url] = UrlMeta()
+        return meta
+
+    def peek(self, url: str) -> Optional[UrlMeta]:
+        return self._data.get(url)
+
+    def seed(self, url: str, size: int, etag: str = None, last_modified: str = None) -> UrlMeta:
+        """别处已经知道的结果（比如续传日志里已完成的记录）直接填进来，视同 HEAD 过，不再发请求"""
+        meta = self.get(url)
+        meta.is_dir, meta.size, meta.size_exact = False, size, True
+        meta.etag = meta.etag or etag
+        meta.last_modified = meta.last_modified or last_modified
+        meta.probed = True
+        return meta
+
+    def compact(self, url: str):
+        """
+        文件已分类、大小已记进文件列表后调用：没 HEAD 过的条目直接丢掉（信息都在文件列表里），
+        HEAD 过的只留下载要用的校验信息（ETag/Last-Modified/Accept-Ranges）
+        """
+        meta = self._data.get(url)
+        if meta is None or meta.is_dir:
+            return
+        if not meta.probed and url not in self._inflight:
+            del self._data[url]
+        else:
+            meta.ctype = None
+
+    def forget(self, url: str):
+        self._data.pop(url, None)
+
+    def hint(self, url: str, tail: str = "", exts=()) -> UrlMeta:
+        """用列表页已有信息猜测类型和大小，不发请求"""
+        meta = self.get(url)
+        if meta.probed:
+            return meta
+        path = urlparse(url).path
+        if path.endswith("/"):
+            meta.is_dir = True
+            return meta
+        is_dir, size, exact = parse_size(tail)
+        if is_dir is not None:
+            meta.is_dir = is_dir
+        if size is not None and not meta.size_exact:
+            meta.size, meta.size_exact = size, exact
+        if meta.is_dir is None:
+            suf = posixpath.splitext(path)[1].lower()
+            if suf in FILE_EXTS or suf in exts:
+                meta.is_dir = False
+        return meta
+
+    async def probe(self, session: aiohttp.ClientSession, url: str) -> UrlMeta:
+        """HEAD 一次并缓存；失败时 meta.probed 仍为 False"""
+        meta = self.get(url)
+        if meta.probed:
+            return meta
+        fut = self._inflight.get(url)
+        if fut is not None:
+            return await asyncio.shield(fut)
+        fut = self._inflight[url] = asyncio.get_running_loop().create_future()
+        m = self.metrics
+        t0 = time.perf_counter()
+        try:
+            self.probes += 1
+            async with session.head(url, allow_redirects=True,
+                                    timeout=aiohttp.ClientTimeout(total=30)) as resp:
+                if m is not None:
+                    m.observe("head_seconds", time.perf_counter() - t0, host=host_of(url))
+                    m.inc("requests_total", host=host_of(url), method="HEAD", status=resp.status)
+                resp.raise_for_status()
+                meta.update_from_headers(resp.headers, url)
+                meta.probed = True
+        except Exception as e:
+            if m is not None:           # 失败不抛出（调用方按未知处理），但要留下记录
+                m.error("head", url, e)
+        finally:
+            fut.set_result(meta)
+            del self._inflight[url]
+        return meta
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标：计数器、耗时直方图、事件循环延迟、逐文件结果
+热路径只做 dict 累加，导出时才整理
+  crawler.metrics.prometheus()          Prometheus 文本格式
+  crawler.metrics.to_dict()             JSON（含出过问题的文件明细和最近的错误）
+  await crawler.metrics.serve(port=9100)  挂一个 /metrics 端点（另有 /metrics.json）
+多个任务可以传入同一个 Metrics，按 host 标签区分
+顺利完成（一次成功、没出错）的文件只计数不留明细，all_files=True 时全部保留
+"""
+import asyncio, bisect, contextlib, json, statistics, time
+from collections import defaultdict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+PREFIX = "batchdownload_"
+# 秒；最后一个桶之外归入 +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+HELP = {
+    "requests_total": "HTTP 请求数（按主机、方法、状态码）",
+    "bytes_total": "下载的响应体字节数",
+    "retries_total": "下载重试次数",
+    "requeued_total": "因主机熔断放回队列的文件数",
+    "circuit_trips_total": "主机熔断次数",
+    "errors_total": "各环节的异常数（按环节、主机、异常类型）",
+    "listings_total": "列目录次数（按来源：static / browser / 304 / cache）",
+    "files": "各最终状态的文件数",
+    "listing_seconds": "列一个目录的耗时",
+    "head_seconds": "HEAD 探测耗时",
+    "response_seconds": "下载请求到收到响应头的耗时",
+    "wait_seconds": "下载排队耗时（budget 全局名额 / host 主机名额 / throttle 限流退避）",
+    "transfer_seconds": "单个文件的读网络 / 写盘 / 摘要耗时",
+    "loop_lag_seconds": "事件循环被阻塞的时间",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """按桶估计：返回第一个累计数达到 q 的桶上界（落在 +Inf 时返回 max）"""
+        need, acc = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= need and c:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {"count": self.count, "sum": round(self.sum, 6), "max": round(self.max, 6),
+                "mean": round(self.sum / self.count, 6) if self.count else None,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+
+class LoopLag:
+    """
+    每 interval 秒醒一次，记下比预期晚了多久（事件循环被阻塞的时间）
+    给了 sink 时每个样本交给 sink(秒)，否则攒着等 take()
+    """
+
+    def __init__(self, interval: float = 0.01, sink: Callable[[float], None] = None):
+        self.interval = interval
+        self.sink = sink
+        self._samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - t0 - self.interval)
+            if self.sink is not None:
+                self.sink(lag)
+            else:
+                self._samples.append(lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def cancel(self):
+        """不等待的停止（在同步代码里用）"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+        return task
+
+    async def stop(self):
+        task = self.cancel()
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+
+    def take(self) -> dict:
+        """返回并清空本阶段的统计（毫秒）"""
+        s, self._samples = sorted(self._samples), []
+        if not s:
+            return {"samples": 0}
+        return {"samples": len(s), "mean_ms": round(statistics.fmean(s) * 1000, 3),
+                "p99_ms": round(s[min(len(s) - 1, int(len(s) * 0.99))] * 1000, 3),
+                "max_ms": round(s[-1] * 1000, 3)}
+
+
+class Metrics:
+    def __init__(self, lag_interval: float = 0.1, keep_errors: int = 200, all_files: bool = False):
+        self.counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        self.hists: Dict[Tuple[str, Labels], Histogram] = {}
+        self.files: Dict[str, dict] = {}        # url -> 最终状态、字节、耗时、尝试次数、最后的错误
+        self.all_files = all_files
+        self._clean: Dict[str, str] = {}        # 顺利完成、明细已丢掉的文件 -> 状态
+        self._states: Dict[str, int] = defaultdict(int)
+        self.errors = deque(maxlen=keep_errors)  # 最近的异常明细
+        self.started = time.time()
+        self._lag = LoopLag(lag_interval, lambda s: self.observe("loop_lag_seconds", s))
+        self._active = 0
+
+    # ---------- 记录（热路径） ----------
+    def inc(self, name: str, value: float = 1, **labels):
+        self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        h = self.hists.get(key)
+        if h is None:
+            h = self.hists[key] = Histogram()
+        h.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def error(self, where: str, url: str, exc: BaseException):
+        """记一次异常：计数 + 最近明细，不抛出"""
+        kind = type(exc).__name__
+        self.inc("errors_total", where=where, host=host_of(url), type=kind)
+        self.errors.append({"time": time.time(), "where": where, "url": url, "type": kind,
+                            "message": str(exc)[:300]})
+        rec = self.files.get(url)
+        if rec is not None:
+            rec["error"] = f"{kind}: {exc}"[:300]
+
+    def record(self, url: str, **info):
+        """补充某个文件的明细（尝试次数、跳过原因……），最终状态由 outcome() 给出"""
+        self.files.setdefault(url, {}).update(info)
+
+    def outcome(self, url: str, state: str, **info):
+        rec = self.files.pop(url, {})
+        prev = rec.get("state") or self._clean.pop(url, None)
+        if prev is not None:
+            self._states[prev] -= 1
+        self._states[state] += 1
+        rec.update(info, state=state)
+        # done / skipped 且一次成功：只留状态（状态可能被之后的校验失败改写）
+        if not self.all_files and state in ("done", "skipped") and "error" not in rec \
+                and rec.get("attempts", 1) <= 1:
+            self._clean[url] = state
+        else:
+            self.files[url] = rec
+
+    # ---------- 事件循环延迟（各阶段嵌套时计数） ----------
+    def start(self):
+        self._active += 1
+        if self._active == 1:
+            self._lag.start()
+
+    def stop(self):
+        self._active = max(0, self._active - 1)
+        if self._active == 0:
+            self._lag.cancel()
+
+    # ---------- 导出 ----------
+    def states(self) -> Dict[str, int]:
+        return {k: v for k, v in self._states.items() if v}
+
+    def to_dict(self, files: bool = True) -> dict:
+        def _group(items, fmt):
+            out: Dict[str, list] = {}
+            for (name, labels), v in sorted(items, key=lambda kv: kv[0]):
+                out.setdefault(name, []).append({**dict(labels), **fmt(v)})
+            return out
+
+        data = {"started": self.started, "time": time.time(), "states": self.states(),
+                "counters": _group(self.counters.items(), lambda v: {"value": v}),
+                "histograms": _group(self.hists.items(), Histogram.as_dict),
+                "errors": list(self.errors)}
+        if files:
+            data["files"] = self.files
+        return data
+
+    def prometheus(self) -> str:
+        lines: List[str] = []
+        typed = set()
+
+        def _head(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {PREFIX}{name} {HELP[name]}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), v in sorted(self.counters.items()):
+            _head(name, "counter")
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {int(v) if v == int(v) else v}")
+        for state, n in sorted(self.states().items()):
+            _head("files", "gauge")
+            lines.append(f"{PREFIX}files{_labels((('state', state),))} {n}")
+        for (name, labels), h in sorted(self.hists.items(), key=lambda kv: kv[0]):
+            _head(name, "histogram")
+            acc = 0
+            for le, c in zip((*BUCKETS, "+Inf"), h.counts):
+                acc += c
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', str(le)),))} {acc}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {h.sum:.6f}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """.prom 结尾写 Prometheus 文本（可给 node_exporter textfile），否则写 JSON"""
+        with open(path, "w", encoding="utf-8") as f:
+            if str(path).endswith(".prom"):
+                f.write(self.prometheus())
+            else:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 9100):
+        """启动 HTTP 端点，返回 aiohttp AppRunner（用完 await runner.cleanup()）"""
+        from aiohttp import web
+
+        async def _text(req):
+            return web.Response(text=self.prometheus(), content_type="text/plain", charset="utf-8")
+
+        async def _json(req):
+            return web.json_response(self.to_dict(files="files" in req.query))
+
+        app = web.Application()
+        app.router.add_get("/metrics", _text)
+        app.router.add_get("/metrics.json", _json)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
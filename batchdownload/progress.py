@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进度事件总线
+下载热路径上只做整数累加；后台按固定频率合并成一份快照，推给订阅的 sink
+sink 是任意可调用对象 sink(snapshot)，可选 close()（shutdown() 时调用）；内置 tqdm 汇总条、JSON-lines 日志、回调
+"""
+import asyncio, json, sys, time
+from typing import Callable, Dict, List, Optional, Tuple
+
+WAITING, RUNNING, DONE, SKIPPED, FAILED, STOPPED = (
+    "waiting", "downloading", "done", "skipped", "failed", "stopped")
+FINAL = {DONE, SKIPPED, FAILED, STOPPED}
+SCAN, DOWNLOAD = "scan", "download"
+
+
+class FileProgress:
+    __slots__ = ("url", "name", "total", "done", "state", "started", "finished", "_mark", "rate")
+
+    def __init__(self, url: str, name: str, total: int = 0):
+        self.url, self.name, self.total = url, name, total
+        self.done = 0
+        self.state = WAITING
+        self.started = self.finished = None
+        self._mark = 0              # 上次快照时的 done
+        self.rate = 0.0
+
+    def as_dict(self) -> dict:
+        left = max(0, self.total - self.done)
+        eta = left / self.rate if self.rate > 0 and self.total else None
+        end = self.finished or time.time()
+        return {"url": self.url, "name": self.name, "state": self.state,
+                "done": self.done, "total": self.total, "rate": self.rate, "eta": eta,
+                "elapsed": end - self.started if self.started else 0.0}
+
+
+class Progress:
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.files: Dict[str, FileProgress] = {}     # 进行中的，以及结束了但还没推送过的文件
+        # 已结束并推送过的文件只留 url -> (状态, 总大小, 已下载)，计数/字节另外累计
+        self._final: Dict[str, Tuple[str, int, int]] = {}
+        self._final_counts: Dict[str, int] = {}
+        self._final_total = 0
+        self._phases: List[str] = []
+        self.dirs_done = self.dirs_total = 0
+        self.bytes = 0
+        self._sinks: List[Callable] = []
+        self._dirty = set()
+        self._task: Optional[asyncio.Task] = None
+        self._last = (time.monotonic(), 0)
+        self.rate = 0.0
+
+    # ---------- 订阅 ----------
+    def subscribe(self, sink: Callable[[dict], None]) -> Callable:
+        self._sinks.append(sink)
+        return sink
+
+    def unsubscribe(self, sink: Callable):
+        if sink in self._sinks:
+            self._sinks.remove(sink)
+
+    @property
+    def has_sinks(self) -> bool:
+        return bool(self._sinks)
+
+    @property
+    def phase(self) -> str:
+        """流水线模式下扫描和下载同时进行，以下载为准"""
+        if DOWNLOAD in self._phases:
+            return DOWNLOAD
+        return self._phases[-1] if self._phases else "idle"
+
+    def reset(self):
+        self.files.clear()
+        self._final.clear()
+        self._final_counts = {}
+        self._final_total = 0
+        self._dirty = set()
+        self.bytes = 0
+        self._last = (time.monotonic(), 0)
+
+    # ---------- 结束的文件收起来 / 取回 ----------
+    def _retire(self, fp: FileProgress):
+        self._final[fp.url] = (fp.state, fp.total, fp.done)
+        self._final_counts[fp.state] = self._final_counts.get(fp.state, 0) + 1
+        self._final_total += fp.total
+        del self.files[fp.url]
+
+    def _revive(self, url: str, name: str = None) -> Optional[FileProgress]:
+        """收起来的文件又有动静（重下、校验失败改状态）：放回 files"""
+        rec = self._final.pop(url, None)
+        if rec is None:
+            return None
+        state, total, done = rec
+        self._final_counts[state] -= 1
+        self._final_total -= total
+        fp = self.files[url] = FileProgress(url, name or url.rsplit("/", 1)[-1], total)
+        fp.state, fp.done, fp._mark = state, done, done
+        return fp
+
+    def get(self, url: str) -> Optional[FileProgress]:
+        return self.files.get(url) or self._revive(url)
+
+    # ---------- 热路径（只做累加） ----------
+    def add(self, url: str, name: str, total: int = 0):
+        fp = self.files.get(url) or self._revive(url, name)
+        if fp is None:
+            fp = self.files[url] = FileProgress(url, name, total)
+        self._dirty.add(url)
+        return fp
+
+    def start(self, url: str, total: int = None, done: int = 0):
+        fp = self.get(url) or self.add(url, url.rsplit("/", 1)[-1])
+        if total:
+            fp.total = total
+        self.bytes += done - fp.done
+        fp.done = fp._mark = done
+        fp.state = RUNNING
+        fp.started = fp.started or time.time()
+        self._dirty.add(url)
+
+    def advance(self, url: str, n: int):
+        self.files[url].done += n
+        self.bytes += n
+        self._dirty.add(url)
+
+    def finish(self, url: str, state: str = DONE):
+        fp = self.files.get(url)
+        if fp is None and state == FAILED:
+            fp = self._revive(url)
+        if fp is None or (fp.state in FINAL and state != FAILED):    # 校验失败可覆盖已完成
+            return
+        if state in (DONE, SKIPPED) and fp.total:
+            self.bytes += fp.total - fp.done
+            fp.done = fp.total
+        fp.state = state
+        fp.finished = time.time()
+        self._dirty.add(url)
+
+    def settle(self, url: str, stopped: bool) -> Optional[str]:
+        """
+        下载协程结束时兜底：成功/跳过/失败都由下载代码明确给出，
+        还没有最终状态的停止时记 stopped，否则记 failed（不当作成功）；返回兜底记下的状态
+        """
+        fp = self.files.get(url)
+        if fp is None or fp.state in FINAL:
+            return None
+        state = STOPPED if stopped else FAILED
+        self.finish(url, state)
+        return state
+
+    # ---------- 快照 ----------
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        dt = max(now - self._last[0], 1e-6)
+        self.rate = (self.bytes - self._last[1]) / dt
+        self._last = (now, self.bytes)
+        changed = []
+        for url in self._dirty:
+            fp = self.files.get(url)
+            if fp is None:
+                continue
+            fp.rate = (fp.done - fp._mark) / dt if fp.state == RUNNING else 0.0
+            fp._mark = fp.done
+            changed.append(fp.as_dict())
+            if fp.state in FINAL:
+                self._retire(fp)
+        self._dirty = set()
+        counts = {k: v for k, v in self._final_counts.items() if v}
+        total_bytes = self._final_total
+        for fp in self.files.values():
+            counts[fp.state] = counts.get(fp.state, 0) + 1
+            total_bytes += fp.total
+        left = max(0, total_bytes - self.bytes)
+        return {
+            "time": time.time(), "phase": self.phase,
+            "dirs_done": self.dirs_done, "dirs_total": self.dirs_total,
+            "files_total": len(self.files) + len(self._final), "states": counts,
+            "bytes": self.bytes, "bytes_total": total_bytes, "rate": self.rate,
+            "eta": left / self.rate if self.rate > 0 and total_bytes else None,
+            "files": changed,       # 只含上次快照后有变化的文件
+        }
+
+    def emit(self):
+        if not self._sinks:
+            for url in self._dirty:
+                fp = self.files.get(url)
+                if fp is not None and fp.state in FINAL:
+                    self._retire(fp)
+            self._dirty = set()
+            return
+        snap = self.snapshot()
+        for sink in list(self._sinks):
+            try:
+                sink(snap)
+            except Exception:
+                pass                # sink 出错不影响下载
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.emit()
+
+    def open(self, phase: str):
+        """开始一个阶段（可嵌套），第一次进入时启动定时推送"""
+        self._phases.append(phase)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._tick())
+
+    def close(self, phase: str):
+        """结束一个阶段；全部结束时停止定时推送并推最后一帧（仍带着该阶段），sink 不关"""
+        if self._phases == [phase]:
+            if self._task is not None:
+                self._task.cancel()
+                self._task = None
+            self.emit()
+        self._phases.remove(phase)
+
+    def shutdown(self):
+        """不再使用时调用：关闭并移除全部 sink（JsonLinesSink 打开的文件等）"""
+        sinks, self._sinks = self._sinks, []
+        for sink in sinks:
+            closer = getattr(sink, "close", None)
+            if closer is not None:
+                closer()
+
+
+# ---------- 内置 sink ----------
+_ansi_ready = False
+
+
+def enable_ansi():
+    """Windows 控制台默认不认 ANSI 转义（进度条刷新要用），只在真正往终端画进度时开一次"""
+    global _ansi_ready
+    if _ansi_ready or sys.platform != "win32":
+        return
+    _ansi_ready = True
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
+    except (AttributeError, OSError):
+        pass
+
+
+class TqdmSink:
+    """终端只画一条汇总进度条（扫描阶段按目录，下载阶段按字节）"""
+
+    def __init__(self):
+        from tqdm import tqdm      # 只有用到终端进度条才加载
+        enable_ansi()
+        self._tqdm = tqdm
+        self._bar = None
+        self._phase = None
+
+    def __call__(self, snap: dict):
+        if snap["phase"] != self._phase and snap["phase"] != "idle":
+            self.close()
+            self._phase = snap["phase"]
+            if self._phase == SCAN:
+                self._bar = self._tqdm(total=0, desc="ScanDirs", unit="dir")
+            else:
+                self._bar = self._tqdm(total=0, desc="Files", unit="B", unit_scale=True)
+        if self._bar is None:
+            return
+        if self._phase == SCAN:
+            self._bar.total, self._bar.n = snap["dirs_total"], snap["dirs_done"]
+        else:
+            st = snap["states"]
+            finished = sum(st.get(k, 0) for k in FINAL)
+            self._bar.total, self._bar.n = snap["bytes_total"], snap["bytes"]
+            post = f"{finished}/{snap['files_total']} files"
+            if snap["dirs_done"] < snap["dirs_total"]:
+                post += f", {snap['dirs_done']}/{snap['dirs_total']} dirs"
+            self._bar.set_postfix_str(post, refresh=False)
+        self._bar.refresh()
+
+    def close(self):
+        if self._bar is not None:
+            self._bar.close()
+            self._bar = None
+            self._phase = None
+
+
+class JsonLinesSink:
+    """每帧一行 JSON，写到文件路径或已打开的流（默认 stdout）"""
+
+    def __init__(self, target=None):
+        if target is None:
+            self._fh, self._own = sys.stdout, False
+        elif hasattr(target, "write"):
+            self._fh, self._own = target, False
+        else:
+            self._fh, self._own = open(target, "a", encoding="utf-8"), True
+
+    def __call__(self, snap: dict):
+        self._fh.write(json.dumps(snap, ensure_ascii=False) + "\n")
+        self._fh.flush()
+
+    def close(self):
+        if self._own:
+            self._fh.close()
+
+
+class CallbackSink:
+    """把快照转交给回调；GUI 可传 lambda s: root.after(0, apply, s) 切回主线程"""
+
+    def __init__(self, fn: Callable[[dict], None], on_close: Callable[[], None] = None):
+        self._fn, self._on_close = fn, on_close
+
+    def __call__(self, snap: dict):
+        self._fn(snap)
+
+    def close(self):
+        if self._on_close is not None:
+            self._on_close()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+令牌桶限速：全局上限 + 按主机上限
+每次读块前先拿令牌；桶内用 FIFO 锁排队，同时下载的文件轮流拿到令牌，带宽自然均分
+速率可在运行中随时修改（包括从 GUI 线程），正在传输的文件不用重启
+"""
+import asyncio, time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+MIN_CHUNK, MAX_CHUNK = 4 * 1024, 1024 * 1024
+TICK = 0.05                         # 每个文件大约每 50ms 拿一次令牌
+
+
+class TokenBucket:
+    def __init__(self, rate: Optional[float] = None):
+        self.rate = rate or None    # 字节/秒，None 不限速
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, rate: Optional[float]):
+        self.rate = rate or None
+
+    async def take(self, n: int):
+        if not self.rate:
+            return
+        async with self._lock:
+            while True:
+                rate = self.rate
+                if not rate:
+                    return
+                burst = max(rate * 0.5, n)
+                now = time.monotonic()
+                self._tokens = min(burst, self._tokens + (now - self._stamp) * rate)
+                self._stamp = now
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                # 分段睡眠，中途改了速率也能很快生效
+                await asyncio.sleep(min((n - self._tokens) / rate, 0.25))
+
+
+class Bandwidth:
+    """全局 + 按主机限速；多个任务可共享同一个实例"""
+
+    def __init__(self, rate: Optional[float] = None, per_host: Dict[str, float] = None):
+        self.total = TokenBucket(rate)
+        self._hosts: Dict[str, TokenBucket] = {}
+        self._active: Dict[str, int] = {}
+        for host, r in (per_host or {}).items():
+            self.set_rate(r, host)
+
+    def set_rate(self, rate: Optional[float], host: str = None):
+        """rate 为字节/秒，0/None 取消限制；host 为空时改全局"""
+        if host is None:
+            self.total.set_rate(rate)
+        elif host in self._hosts:
+            self._hosts[host].set_rate(rate)
+        else:
+            self._hosts[host] = TokenBucket(rate)
+
+    def rates(self) -> dict:
+        return {"total": self.total.rate,
+                "hosts": {h: b.rate for h, b in self._hosts.items()}}
+
+    def limited(self, url: str) -> bool:
+        b = self._hosts.get(urlparse(url).netloc)
+        return bool(self.total.rate or (b is not None and b.rate))
+
+    async def take(self, url: str, n: int):
+        await self.total.take(n)
+        b = self._hosts.get(urlparse(url).netloc)
+        if b is not None:
+            await b.take(n)
+
+    # ---------- 活跃文件登记，用于算块大小 ----------
+    def enter(self, url: str):
+        host = urlparse(url).netloc
+        self._active[host] = self._active.get(host, 0) + 1
+
+    def leave(self, url: str):
+        host = urlparse(url).netloc
+        self._active[host] -= 1
+
+    def chunk_size(self, url: str, default: int) -> int:
+        """限速时按每个文件分到的速率取约 50ms 的量，不限速用调用方给的块大小"""
+        host = urlparse(url).netloc
+        rates = [r for r in (self.total.rate, getattr(self._hosts.get(host), "rate", None)) if r]
+        if not rates:
+            return default
+        active = sum(self._active.values()) if min(rates) == self.total.rate else self._active.get(host, 1)
+        share = min(rates) / max(1, active)
+        return int(min(MAX_CHUNK, max(MIN_CHUNK, share * TICK)))
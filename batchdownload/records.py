@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑的文件列表（fetch() 的返回值）
+按列存储：目录前缀去重后只存一份，每个文件只占 一个文件名字符串 + 4 字节前缀下标 + 8 字节大小
+取出来的每一项是只读的 Mapping 视图（"url"/"name"/"size"），用法和原来的 dict 一样；
+需要真正的 dict（比如 json.dumps）时用 dict(item) 或 FileList.to_dicts()
+"""
+from array import array
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List, Set
+
+
+class FileRecord(Mapping):
+    """FileList 里一项的视图，只保存所属列表和下标；"size" 可写回"""
+    __slots__ = ("_list", "_i")
+    KEYS = ("url", "name", "size")
+
+    def __init__(self, owner: "FileList", i: int):
+        self._list, self._i = owner, i
+
+    def __getitem__(self, key):
+        lst, i = self._list, self._i
+        if key == "url":
+            return lst._prefixes[lst._pidx[i]] + lst._names[i]
+        if key == "name":
+            return lst._names[i]
+        if key == "size":
+            return lst._sizes[i]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key != "size":
+            raise KeyError(f"只能修改 size: {key}")
+        self._list._sizes[self._i] = value or 0
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class FileList:
+    """按 URL 去重的文件列表，追加顺序即扫描顺序"""
+
+    def __init__(self, items=()):
+        self._prefixes: List[str] = []      # 目录前缀（含结尾 /），每个只存一份
+        self._prefix_ids: Dict[str, int] = {}
+        self._pidx = array("I")
+        self._names: List[str] = []
+        self._sizes = array("q")
+        self._seen: List[Set[str]] = []     # 每个前缀下已有的文件名，用于去重
+        for it in items:
+            self.append(it)
+
+    def append(self, item, size: int = 0) -> bool:
+        """item 可以是 url 字符串或带 url/size 的 dict；重复的 URL 忽略，返回是否新增"""
+        if not isinstance(item, str):
+            item, size = item["url"], item.get("size", 0)
+        prefix, _, name = item.rpartition("/")
+        prefix += "/"
+        pid = self._prefix_ids.get(prefix)
+        if pid is None:
+            pid = self._prefix_ids[prefix] = len(self._prefixes)
+            self._prefixes.append(prefix)
+            self._seen.append(set())
+        if name in self._seen[pid]:
+            return False
+        self._seen[pid].add(name)
+        self._pidx.append(pid)
+        self._names.append(name)
+        self._sizes.append(size or 0)
+        return True
+
+    def retain(self, keep: Callable[[FileRecord], bool]):
+        """原地只保留 keep(item) 为真的项"""
+        kept = [i for i in range(len(self._names)) if keep(FileRecord(self, i))]
+        self._pidx = array("I", (self._pidx[i] for i in kept))
+        self._names = [self._names[i] for i in kept]
+        self._sizes = array("q", (self._sizes[i] for i in kept))
+        self._seen = [set() for _ in self._prefixes]
+        for pid, name in zip(self._pidx, self._names):
+            self._seen[pid].add(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [FileRecord(self, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return FileRecord(self, i)
+
+    def __iter__(self) -> Iterator[FileRecord]:
+        for i in range(len(self._names)):
+            yield FileRecord(self, i)
+
+    def __contains__(self, url) -> bool:
+        prefix, _, name = url.rpartition("/")
+        pid = self._prefix_ids.get(prefix + "/")
+        return pid is not None and name in self._seen[pid]
+
+    def __repr__(self):
+        return f"FileList({len(self)} files, {len(self._prefixes)} dirs)"
+
+    def to_dicts(self) -> List[dict]:
+        return [dict(it) for it in self]
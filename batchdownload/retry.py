@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载重试：错误分类、指数退避 + 抖动、按主机熔断
+- 4xx（408/425/429 除外）、URL 无效、磁盘写满等致命错误不重试
+- 可重试的错误按 base * 2^(n-1) 封顶 cap 退避，取 [0, 上限] 内随机值（full jitter），
+  服务器给了 Retry-After 时不早于它
+- 某主机连续 threshold 次可重试失败即熔断 cooldown 秒：期间该主机的文件放回队列末尾，
+  下载协程先去下其他主机的文件；冷却结束放一个探测请求，成功恢复，失败冷却翻倍（封顶 max_cooldown）
+- 重试用尽不删 .part，续传日志保留已落盘的偏移，下次运行接着下
+"""
+import asyncio, errno, random, time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+from .adaptive import parse_retry_after
+
+RETRY, FATAL = "retry", "fatal"
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# 本地磁盘问题，重试也没用
+FATAL_ERRNO = {errno.ENOSPC, errno.EROFS, errno.EACCES, errno.EPERM, errno.ENAMETOOLONG,
+               getattr(errno, "EDQUOT", errno.ENOSPC)}
+
+
+def classify(exc: BaseException) -> str:
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return RETRY if exc.status in RETRY_STATUS or exc.status >= 500 else FATAL
+    if isinstance(exc, (aiohttp.InvalidURL, aiohttp.TooManyRedirects)):
+        return FATAL
+    if isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError)):
+        return RETRY                # 连接被重置、超时、响应体不完整……
+    if isinstance(exc, OSError):
+        return FATAL if exc.errno in FATAL_ERRNO else RETRY
+    return RETRY
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(exc, "headers", None)
+    return parse_retry_after(headers.get("Retry-After")) if headers else None
+
+
+class RetryPolicy:
+    """attempts 为单个文件连续尝试次数；requeue 为主机熔断时最多放回队列几次"""
+
+    def __init__(self, attempts: int = 6, base: float = 0.5, cap: float = 60.0,
+                 jitter: bool = True, requeue: int = 5):
+        self.attempts = max(1, attempts)
+        self.base, self.cap, self.jitter = base, cap, jitter
+        self.requeue = requeue
+
+    def delay(self, attempt: int, exc: BaseException = None) -> float:
+        """第 attempt 次失败后等多久"""
+        ceiling = min(self.cap, self.base * 2 ** (attempt - 1))
+        wait = random.uniform(0, ceiling) if self.jitter else ceiling
+        hinted = retry_after(exc) if exc is not None else None
+        return max(wait, min(hinted, self.cap)) if hinted is not None else wait
+
+
+class CircuitOpen(Exception):
+    """主机熔断中，文件应放回队列稍后再试"""
+
+    def __init__(self, host: str, wait: float):
+        super().__init__(f"{host} 熔断中，{wait:.1f}s 后重试")
+        self.host, self.wait = host, wait
+
+
+class _Circuit:
+    __slots__ = ("failures", "opened_until", "cooldown", "probing", "trips")
+
+    def __init__(self, cooldown: float):
+        self.failures = 0
+        self.opened_until = 0.0     # 0 为闭合
+        self.cooldown = cooldown
+        self.probing = 0.0          # 半开时探测请求发出的时间
+        self.trips = 0
+
+
+class CircuitBreakers:
+    def __init__(self, threshold: int = 5, cooldown: float = 10.0, max_cooldown: float = 300.0):
+        self.threshold = max(1, threshold)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max(cooldown, max_cooldown)
+        self._hosts: Dict[str, _Circuit] = {}
+
+    def _get(self, url: str) -> _Circuit:
+        host = urlparse(url).netloc
+        c = self._hosts.get(host)
+        if c is None:
+            c = self._hosts[host] = _Circuit(self.base_cooldown)
+        return c
+
+    def blocked(self, url: str) -> float:
+        """还要等多少秒才能向该主机发请求；0 为可以（不占探测名额）"""
+        c = self._get(url)
+        if not c.opened_until:
+            return 0.0
+        now = time.monotonic()
+        if now < c.opened_until:
+            return c.opened_until - now
+        if c.probing and now - c.probing < c.cooldown:
+            return min(1.0, c.cooldown)     # 探测请求还没回来
+        return 0.0
+
+    def check(self, url: str):
+        """发请求前调用：熔断中抛 CircuitOpen；冷却结束后第一个调用者成为探测请求"""
+        wait = self.blocked(url)
+        if wait > 0:
+            raise CircuitOpen(urlparse(url).netloc, wait)
+        c = self._get(url)
+        if c.opened_until:
+            c.probing = time.monotonic()
+
+    def on_success(self, url: str):
+        """主机有正常响应（包括不可重试的 4xx）"""
+        c = self._get(url)
+        c.failures, c.opened_until, c.probing = 0, 0.0, 0.0
+        c.cooldown = self.base_cooldown
+
+    def on_failure(self, url: str, delay: float = None) -> bool:
+        """可重试的失败；delay 为服务器要求的暂停（Retry-After）。返回是否因此熔断"""
+        c = self._get(url)
+        c.failures += 1
+        if c.opened_until:
+            if not c.probing:                   # 熔断前就发出的请求，不重复计
+                return False
+            c.cooldown = min(self.max_cooldown, c.cooldown * 2)     # 探测失败：冷却翻倍
+        elif c.failures < self.threshold:
+            return False
+        c.opened_until = time.monotonic() + max(c.cooldown, delay or 0)
+        c.probing = 0.0
+        c.trips += 1
+        return True
+
+    def snapshot(self) -> Dict[str, dict]:
+        now = time.monotonic()
+        return {h: {"failures": c.failures, "open": max(0.0, c.opened_until - now),
+                    "cooldown": c.cooldown, "trips": c.trips}
+                for h, c in self._hosts.items()}
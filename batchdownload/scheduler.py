@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载调度：决定文件的下载顺序，以及哪些走小文件车道
+  largest   大文件先下（默认），尾部不会剩一个大文件拖长总时间
+  smallest  小文件先下，尽快看到结果
+  crawl     按发现顺序
+  也可以传 key(item) -> 可比较值 的函数
+priority 为规则列表（写法同黑白名单，见 filters.py），命中越靠前的规则越先下，同级再按 policy
+已知大小不超过 small_size 的文件进小文件车道：不 HEAD、不预分配、不写续传偏移，
+整个读进内存后一次写盘；small_workers 个协程优先取小文件，空了也帮着下大文件（反之亦然）
+两条车道各自按 policy / priority 排序、各自有缓冲上限，互不挤占
+fetch() 后的 download() 两条车道各自全局排序、各有一个协程供货；run() 边扫边下时只在待下载缓冲区内排序
+"""
+import asyncio, heapq, itertools
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .filters import Matcher
+
+POLICIES = ("largest", "smallest", "crawl")
+SMALL_SIZE = 256 * 1024
+
+
+class Scheduler:
+    def __init__(self, policy: Union[str, Callable] = "largest", priority: Sequence[str] = (),
+                 small_size: int = SMALL_SIZE, small_workers: int = 2):
+        if not callable(policy) and policy not in POLICIES:
+            raise ValueError(f"policy 只能是 {POLICIES} 之一或函数")
+        self.policy = policy
+        self._rules = [Matcher([p]) for p in priority if p.strip()]
+        self.small_size = small_size
+        self.small_workers = max(0, small_workers)
+
+    @property
+    def reorders(self) -> bool:
+        return self.policy != "crawl" or bool(self._rules)
+
+    def is_small(self, size: Optional[int]) -> bool:
+        return bool(size) and size <= self.small_size
+
+    def rank(self, item, rel: str = ""):
+        """越小越先下；大小未知（0）的排在已知的后面"""
+        size = item["size"] or 0
+        pri = len(self._rules)
+        for i, rule in enumerate(self._rules):
+            if rule.match(item["name"], rel, size or None):
+                pri = i
+                break
+        if callable(self.policy):
+            return pri, self.policy(item)
+        if self.policy == "largest":
+            return pri, not size, -size
+        if self.policy == "smallest":
+            return pri, not size, size
+        return (pri,)
+
+    def order(self, items: Iterable, rel: Callable[[str], str] = None) -> List:
+        """稳定排序：同一级别内保持发现顺序"""
+        return sorted(items, key=lambda it: self.rank(it, rel(it["url"]) if rel else ""))
+
+    def split(self, items: Iterable, rel: Callable[[str], str] = None) -> Tuple[List, List]:
+        """分成 (其余, 小文件) 两条车道，各自排好序"""
+        lanes: Tuple[List, List] = ([], [])
+        for it in items:
+            lanes[self.is_small(it["size"])].append(it)
+        if self.reorders:
+            return self.order(lanes[0], rel), self.order(lanes[1], rel)
+        return lanes
+
+
+class Lanes:
+    """
+    两条车道的有界待下载队列：小文件和其余文件各一个按 rank 出队的堆，各自最多 maxsize 个
+    get(small=True) 优先取小文件车道，另一条车道有货时也取；close() 后取空返回 None
+    """
+
+    def __init__(self, scheduler: Scheduler, maxsize: int):
+        self._sched = scheduler
+        self._maxsize = max(1, maxsize)
+        self._lanes: Tuple[list, list] = ([], [])       # (其余, 小文件)
+        self._seq = itertools.count()
+        self._closed = False
+        lock = asyncio.Lock()
+        self._not_empty = asyncio.Condition(lock)
+        self._not_full = asyncio.Condition(lock)
+
+    def __len__(self):
+        return len(self._lanes[0]) + len(self._lanes[1])
+
+    async def put(self, item, rank=()):
+        lane = self._lanes[self._sched.is_small(item["size"])]
+        async with self._not_full:
+            await self._not_full.wait_for(lambda: len(lane) < self._maxsize)
+            heapq.heappush(lane, (rank, next(self._seq), item))
+            self._not_empty.notify()
+
+    async def close(self):
+        async with self._not_empty:
+            self._closed = True
+            self._not_empty.notify_all()
+
+    async def get(self, small: bool = False):
+        async with self._not_empty:
+            await self._not_empty.wait_for(lambda: len(self) or self._closed)
+            if not len(self):
+                return None
+            lane = self._lanes[small] if self._lanes[small] else self._lanes[not small]
+            item = heapq.heappop(lane)[2]
+            self._not_full.notify_all()     # 两条车道的供货协程等在同一个条件上
+            return item
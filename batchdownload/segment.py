@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大文件分段并发下载
+服务器支持 Range 时把文件切成 N 段并发拉取，写进预分配文件（writer.preallocate）的对应偏移
+每段进度通过 save 回调写进续传日志，断点续传按段恢复
+"""
+import asyncio, pathlib
+from typing import Callable, List
+
+import aiohttp
+
+from .retry import FATAL, RetryPolicy, classify
+from .writer import BUFFER, FileWriter
+
+SAVE_EVERY = 4 * 1024 * 1024        # 每段每写这么多字节落一次进度
+
+
+class RangeUnsupported(Exception):
+    """服务器没按 Range 返回 206（不支持或文件已变化），需要回退单连接"""
+
+
+def split(size: int, parts: int) -> List[List[int]]:
+    """切成 [start, end, pos] 列表，end 不含"""
+    step = -(-size // max(1, parts))
+    return [[s, min(s + step, size), s] for s in range(0, size, step)]
+
+
+async def download_segmented(session: aiohttp.ClientSession, url: str,
+                             local: pathlib.Path, ranges: List[List[int]],
+                             chunk: int, stop: asyncio.Event,
+                             save: Callable[[List[List[int]]], None],
+                             advance: Callable[[int], None] = None, validator: str = None,
+                             policy: RetryPolicy = None, body=None,
+                             buffer: int = BUFFER, durability: str = "none",
+                             on_error: Callable[[Exception], None] = None) -> bool:
+    """
+    按 ranges 分段下载到已预分配的 local，返回是否完整完成
+    进度只在写盘（periodic 模式为 fsync）之后才交给 save，进程被杀也不会记下没落盘的字节
+    body(resp) 返回响应体的异步迭代器（用于限速），默认按 chunk 读取
+    advance(n) 每写入 n 字节调用一次（进度计数）；on_error(e) 在每次分段请求出错时调用
+    policy 为每段的重试策略（见 retry.py），致命错误不重试
+    """
+    body = body or (lambda resp: resp.content.iter_chunked(chunk))
+    policy = policy or RetryPolicy(5)
+
+    async def _seg(r: List[int]):
+        for attempt in range(1, policy.attempts + 1):
+            if r[2] >= r[1] or stop.is_set():
+                return
+            headers = {"Range": f"bytes={r[2]}-{r[1] - 1}"}
+            if validator:
+                headers["If-Range"] = validator
+            try:
+                async with session.get(url, headers=headers,
+                                       timeout=aiohttp.ClientTimeout(total=None, connect=30)) as resp:
+                    resp.raise_for_status()
+                    if resp.status != 206:
+                        raise RangeUnsupported(url)
+                    pos = mark = r[2]
+                    w = FileWriter(local, pos, buffer, durability)
+                    await w.open()
+                    try:
+                        async for data in body(resp):
+                            if stop.is_set():
+                                break
+                            data = data[: r[1] - pos]
+                            await w.write(data)
+                            pos += len(data)
+                            if advance is not None:
+                                advance(len(data))
+                            if pos - mark >= SAVE_EVERY:
+                                mark = pos
+                                r[2] = await w.flush()
+                                save(ranges)
+                            if pos >= r[1]:
+                                break
+                    finally:
+                        await w.close()
+                        r[2] = w.safe_offset    # 只记已经写盘的位置
+                        save(ranges)
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                if on_error is not None:
+                    on_error(e)
+                if classify(e) == FATAL or attempt == policy.attempts:
+                    return
+                await asyncio.sleep(policy.delay(attempt, e))
+
+    tasks = [asyncio.ensure_future(_seg(r)) for r in ranges]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # 某段抛出（如 RangeUnsupported）或被取消时，其余段也要停下并等它们关完文件再返回：
+        # 调用方接着会删掉 .part 改走单连接，不能再有残留的写入
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return all(pos >= end for _, end, pos in ranges)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片执行：把一个任务的目录树和文件按 URL 路径的 rendezvous 哈希分给 N 个分片
+  BatchDownload(url, shard=(i, n))   只扫描/下载第 i 片（多台机器共享同一个 store_dir 时各跑一片）
+  run_pool(url, processes=8, ...)    本机起 N 个进程各跑一片，汇总进度和结果
+shard_depth 层以上的目录所有分片都列（通常只有根目录），以下按该层祖先目录整棵子树归一个分片；
+分片层以上的文件按自身路径分。各分片写同一个 store_dir，续传日志按分片分文件，互不加锁
+每个分片把进度摘要写到 store_dir/.shards/<i>-of-<n>.json，任何一台机器都能合并查看：
+  python -m batchdownload.shard status <store_dir>
+"""
+import argparse, asyncio, hashlib, json, multiprocessing, os, pathlib, socket, sys, time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+STATUS_DIR = ".shards"
+SUM_KEYS = ("dirs_done", "dirs_total", "files_total", "bytes", "bytes_total", "rate")
+
+
+def owner(key: str, count: int) -> int:
+    """rendezvous 哈希：分片数变化时只有约 1/n 的键换主"""
+    return max(range(count), key=lambda i: hashlib.blake2b(f"{i}/{key}".encode(), digest_size=8).digest())
+
+
+class Sharding:
+    def __init__(self, index: int, count: int, depth: int = 1):
+        if not 0 <= index < count:
+            raise ValueError(f"分片序号应在 0..{count - 1}: {index}")
+        self.index, self.count, self.depth = index, count, max(1, depth)
+
+    def owns(self, rel: str, is_dir: Optional[bool] = None) -> bool:
+        """
+        rel 为相对根目录的路径；is_dir 未知时只在能确定时返回 False
+        分片层以上的目录所有分片都要列，返回 True
+        """
+        if self.count == 1:
+            return True
+        parts = [p for p in rel.split("/") if p]
+        if len(parts) < self.depth:
+            if is_dir is None or is_dir:
+                return True
+            key = "/".join(parts)
+        else:
+            key = "/".join(parts[:self.depth])
+        return owner(key, self.count) == self.index
+
+    @property
+    def label(self) -> str:
+        return f"{self.index}-of-{self.count}"
+
+
+# ---------- 状态文件 ----------
+def status_path(store_dir, sharding: Sharding) -> pathlib.Path:
+    return pathlib.Path(store_dir) / STATUS_DIR / f"{sharding.label}.json"
+
+
+class ShardStatus:
+    """进度 sink：每帧把摘要原子写进状态文件（不含逐文件明细）"""
+
+    def __init__(self, crawler, sharding: Sharding):
+        self._crawler = crawler
+        self.sharding = sharding
+        self.path = status_path(crawler.store_dir, sharding)
+        self._snap: dict = {}
+
+    def __call__(self, snap: dict):
+        self._snap = {k: v for k, v in snap.items() if k != "files"}
+        self.write()
+
+    def write(self, final: bool = False, error: str = None):
+        data = {**self._snap, "shard": [self.sharding.index, self.sharding.count],
+                "host": socket.gethostname(), "pid": os.getpid(), "updated": time.time(),
+                "excluded": len(self._crawler.excluded),
+                "verify_failed": list(self._crawler.verify_failed),
+                "final": final, "error": error}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+def merge(statuses: List[dict]) -> dict:
+    """把各分片的摘要合成一份，字段与单个快照一致，另附 shards 明细"""
+    out = {k: 0 for k in SUM_KEYS}
+    states: Dict[str, int] = {}
+    failed: List[str] = []
+    shards = {}
+    for st in statuses:
+        for k in SUM_KEYS:
+            out[k] += st.get(k) or 0
+        for k, v in (st.get("states") or {}).items():
+            states[k] = states.get(k, 0) + v
+        failed += st.get("verify_failed") or []
+        shards[f"{st['shard'][0]}-of-{st['shard'][1]}"] = {
+            k: st.get(k) for k in ("phase", "states", "bytes", "rate", "host", "pid",
+                                   "updated", "final", "error")}
+    left = max(0, out["bytes_total"] - out["bytes"])
+    out.update(states=states, verify_failed=failed, shards=shards, time=time.time(),
+               eta=left / out["rate"] if out["rate"] > 0 and out["bytes_total"] else None,
+               final=bool(statuses) and all(st.get("final") for st in statuses))
+    return out
+
+
+def read_status(store_dir, count: int = None) -> dict:
+    """合并 store_dir 下的状态文件；count 为空时取最近一次运行的分片数"""
+    files = list((pathlib.Path(store_dir) / STATUS_DIR).glob("*-of-*.json"))
+    statuses = []
+    for f in files:
+        try:
+            statuses.append(json.loads(f.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue                # 正在被替换
+    if count is None and statuses:
+        count = max(statuses, key=lambda st: st.get("updated", 0))["shard"][1]
+    return merge([st for st in statuses if st["shard"][1] == count])
+
+
+# ---------- 本机多进程 ----------
+async def _shard_main(url: str, shard: Tuple[int, int], crawl: dict, download: dict, pipeline: bool):
+    from .crawler import BatchDownload
+    from .progress import CallbackSink
+    crawler = BatchDownload(url, shard=shard, **crawl)
+    crawler.subscribe(CallbackSink(lambda snap: None))     # 多个进程不各自画 tqdm，进度看状态文件
+    error = None
+    try:
+        if pipeline:
+            await crawler.run(**download)
+        elif await crawler.fetch():
+            await crawler.download(**download)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    crawler.shard_status.write(final=True, error=error)
+
+
+def _shard_entry(url, shard, crawl, download, pipeline):
+    try:
+        asyncio.run(_shard_main(url, shard, crawl, download, pipeline))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_pool(url: str, processes: int = None, pipeline: bool = True, download: dict = None,
+             on_progress: Callable[[dict], None] = None, poll: float = 1.0, **crawl) -> dict:
+    """
+    本机起 processes 个进程（默认 CPU 数）各跑一片；crawl 为 BatchDownload 的参数，
+    download 为 run()/download() 的参数。阻塞到全部结束，返回合并后的状态
+    on_progress(status) 每 poll 秒调用一次
+    """
+    n = max(1, processes or os.cpu_count() or 1)
+    crawl.setdefault("store_dir", urlparse(url).netloc)
+    for old in (pathlib.Path(crawl["store_dir"]) / STATUS_DIR).glob(f"*-of-{n}.json"):
+        old.unlink(missing_ok=True)             # 上一次同样分片数留下的状态
+    ctx = multiprocessing.get_context("spawn")  # 各进程自己建事件循环，不继承父进程状态
+    procs = [ctx.Process(target=_shard_entry, args=(url, (i, n), crawl, download or {}, pipeline),
+                         daemon=True) for i in range(n)]
+    for p in procs:
+        p.start()
+    try:
+        while any(p.is_alive() for p in procs):
+            time.sleep(poll)
+            if on_progress is not None:
+                on_progress(read_status(crawl["store_dir"], n))
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        raise
+    finally:
+        for p in procs:
+            p.join()
+    status = read_status(crawl["store_dir"], n)
+    status["exitcodes"] = [p.exitcode for p in procs]
+    return status
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m batchdownload.shard", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    st = sub.add_parser("status", help="合并显示各分片进度")
+    st.add_argument("store_dir")
+    st.add_argument("--count", type=int, default=None, help="分片数，默认取最近一次运行的")
+    rn = sub.add_parser("run", help="本机多进程分片运行一个任务")
+    rn.add_argument("url")
+    rn.add_argument("-p", "--processes", type=int, default=None)
+    rn.add_argument("--store-dir", default=None)
+    rn.add_argument("--depth", type=int, default=10)
+    rn.add_argument("--shard-depth", type=int, default=1)
+    rn.add_argument("--workers", type=int, default=8, help="每个进程的下载并发")
+    rn.add_argument("--engine", default="auto")
+    args = ap.parse_args(argv)
+    if args.cmd == "status":
+        print(json.dumps(read_status(args.store_dir, args.count), indent=2, ensure_ascii=False))
+        return 0
+    crawl = {"depth": args.depth, "shard_depth": args.shard_depth, "engine": args.engine}
+    if args.store_dir:
+        crawl["store_dir"] = args.store_dir
+
+    def show(s: dict):
+        print(json.dumps({k: s[k] for k in ("states", "bytes", "bytes_total", "rate", "eta")}), flush=True)
+
+    status = run_pool(args.url, args.processes, download={"max_workers": args.workers},
+                      on_progress=show, **crawl)
+    print(json.dumps(status, indent=2, ensure_ascii=False))
+    return 0 if all(c == 0 for c in status["exitcodes"]) and not status["states"].get("failed") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
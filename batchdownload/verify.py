@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载时边收边算摘要，和目录里的 SHA256SUMS/MD5SUMS 等校验清单比对
+支持 GNU 格式（hex  name / hex *name）、BSD 格式（SHA256 (name) = hex）和单文件旁挂（x.iso.sha256）
+"""
+import hashlib, pathlib, posixpath, re
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import quote, urljoin, urlparse, unquote
+
+MANIFEST_NAMES = {
+    "sha256sums": "sha256", "sha256sums.txt": "sha256", "sha256sum.txt": "sha256",
+    "sha512sums": "sha512", "sha512sums.txt": "sha512", "sha512sum.txt": "sha512",
+    "sha1sums": "sha1", "sha1sums.txt": "sha1", "sha1sum.txt": "sha1",
+    "md5sums": "md5", "md5sums.txt": "md5", "md5sum.txt": "md5",
+    "checksums": None, "checksums.txt": None,       # 算法按摘要长度推断
+}
+SIDECAR_EXTS = {".sha256": "sha256", ".sha512": "sha512", ".sha1": "sha1", ".md5": "md5"}
+ALGO_BY_LEN = {32: "md5", 40: "sha1", 64: "sha256", 128: "sha512"}
+
+_GNU_RE = re.compile(r"^([0-9a-fA-F]{32,128})(?:\s+\*?(.+))?$")
+_BSD_RE = re.compile(r"^(MD5|SHA1|SHA256|SHA512)\s*\((.+)\)\s*=\s*([0-9a-fA-F]{32,128})$", re.I)
+
+
+def is_manifest(url: str) -> bool:
+    """扫描时每个文件都要判断一次，用 posixpath（PurePath 会把每段路径 intern 进全局表）"""
+    name = posixpath.basename(unquote(urlparse(url).path)).lower()
+    return name in MANIFEST_NAMES or posixpath.splitext(name)[1] in SIDECAR_EXTS
+
+
+def url_key(url: str) -> str:
+    """清单里的名字和爬到的链接编码方式不一定一样（空格、括号……），两边都解码后再比"""
+    return unquote(url)
+
+
+def parse_manifest(text: str, manifest_url: str) -> Dict[str, Tuple[str, str]]:
+    """返回 {url_key(文件 URL): (算法, 小写 hex)}"""
+    path = pathlib.PurePosixPath(unquote(urlparse(manifest_url).path))
+    sidecar = SIDECAR_EXTS.get(path.suffix.lower())
+    default = sidecar or MANIFEST_NAMES.get(path.name.lower())
+    out = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        m = _BSD_RE.match(line)
+        if m:
+            algo, name, digest = m.group(1).lower(), m.group(2), m.group(3)
+        else:
+            m = _GNU_RE.match(line)
+            if not m:
+                continue
+            digest, name = m.group(1), m.group(2)
+            algo = default or ALGO_BY_LEN.get(len(digest))
+            if name is None:
+                if not sidecar:
+                    continue
+                name = path.stem                # x.iso.sha256 里只有摘要
+        if algo not in ALGO_BY_LEN.values() or len(digest) not in ALGO_BY_LEN:
+            continue
+        name = name.strip()
+        if name.startswith("./"):               # 只去掉 ./ 前缀，.hidden 这类名字原样保留
+            name = name[2:]
+        out[url_key(urljoin(manifest_url, quote(name)))] = (algo, digest.lower())
+    return out
+
+
+class Hasher:
+    """同时维护多个摘要"""
+
+    def __init__(self, algos: Iterable[str]):
+        self._h = {a: hashlib.new(a) for a in algos}
+
+    def __bool__(self):
+        return bool(self._h)
+
+    def update(self, data: bytes):
+        for h in self._h.values():
+            h.update(data)
+
+    def hexdigests(self) -> Dict[str, str]:
+        return {a: h.hexdigest() for a, h in self._h.items()}
+
+
+def hash_file(path: pathlib.Path, algos: Iterable[str], limit: Optional[int] = None,
+              block: int = 1024 * 1024) -> Hasher:
+    """
+    读文件算摘要（阻塞，放线程池里跑）
+    limit 只读前 limit 字节：续传时补上已有部分的摘要状态
+    """
+    hasher = Hasher(algos)
+    left = limit
+    with open(path, "rb") as f:
+        while left is None or left > 0:
+            data = f.read(block if left is None else min(block, left))
+            if not data:
+                break
+            hasher.update(data)
+            if left is not None:
+                left -= len(data)
+    return hasher
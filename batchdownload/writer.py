@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+磁盘写入
+网络块先攒进内存缓冲，满 buffer 字节才交给线程池一次 pwrite，避免每 8KB 一次线程切换
+下载中的数据写在 <文件名>.part，完成后原子改名；长度已知时先 fallocate 预分配，减少碎片
+durability：
+  none      只保证进程崩溃不丢（写进系统缓存），默认
+  file      每个文件完成时 fsync 一次（再改名），掉电后不会出现内容不全的正式文件
+  periodic  下载中每 sync_interval 秒 fsync 一次，续传日志只记已 fsync 的偏移；完成时同 file
+"""
+import asyncio, os, pathlib, sys, time
+from typing import Optional
+
+DURABILITY = ("none", "file", "periodic")
+BUFFER = 1024 * 1024
+SYNC_INTERVAL = 5.0
+PART_SUFFIX = ".part"
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+
+def part_path(local: pathlib.Path) -> pathlib.Path:
+    return local.with_name(local.name + PART_SUFFIX)
+
+
+def preallocate(path: pathlib.Path, size: int):
+    """
+    预分配 size 字节：支持 posix_fallocate 的系统真正分配连续空间，否则截断成稀疏文件
+    已有内容保留（续传时也可以调用）
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | _O_BINARY, 0o644)
+    try:
+        if hasattr(os, "posix_fallocate") and size > 0:
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError:
+                pass                # 文件系统不支持，退回稀疏文件
+        os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+
+def _pwrite(fd: int, data, offset: int):
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            n = os.pwrite(fd, view, offset)
+        else:                       # Windows 没有 pwrite；同一个 fd 同时只有一次写，lseek 安全
+            os.lseek(fd, offset, os.SEEK_SET)
+            n = os.write(fd, view)
+        view, offset = view[n:], offset + n
+
+
+def _fsync_dir(path: pathlib.Path):
+    """改名要落盘还得 fsync 所在目录（Windows 不支持，跳过）"""
+    if sys.platform == "win32":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def commit(part: pathlib.Path, local: pathlib.Path, durability: str = "none"):
+    """.part 改成正式文件名；local 是硬链接时只替换目录项，不会改到共享的内容"""
+    if durability != "none":
+        fd = os.open(part, os.O_RDONLY | _O_BINARY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    os.replace(part, local)
+    if durability != "none":
+        _fsync_dir(local.parent)
+
+
+def write_file(part: pathlib.Path, local: pathlib.Path, data, durability: str = "none"):
+    """小文件一次写完：写 .part、按 durability fsync、改名，整个在一个线程池任务里完成"""
+    fd = os.open(part, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _O_BINARY, 0o644)
+    try:
+        _pwrite(fd, data, 0)
+        if durability != "none":
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(part, local)
+    if durability != "none":
+        _fsync_dir(local.parent)
+
+
+class FileWriter:
+    """
+    从 offset 开始顺序写一个文件（分段下载时每段一个实例，各自偏移互不重叠）
+    safe_offset 为可以记进续传日志的位置
+    """
+
+    def __init__(self, path: pathlib.Path, offset: int = 0, buffer: int = BUFFER,
+                 durability: str = "none", sync_interval: float = SYNC_INTERVAL):
+        if durability not in DURABILITY:
+            raise ValueError(f"durability 只能是 {DURABILITY} 之一")
+        self.path = path
+        self.offset = offset        # 已交给系统的位置
+        self.synced = offset        # 已 fsync 的位置
+        self.buffer = max(1, buffer)
+        self.durability = durability
+        self.sync_interval = sync_interval
+        self._buf = bytearray()
+        self._fd: Optional[int] = None
+        self._last_sync = time.monotonic()
+        self._loop = None
+
+    @property
+    def safe_offset(self) -> int:
+        return self.synced if self.durability == "periodic" else self.offset
+
+    async def _call(self, fn, *args):
+        """
+        线程池里的操作：协程被取消时也等它真正做完再抛出取消，
+        否则取消返回后还可能有写入、甚至新建的文件落到磁盘上（分段下载回退单连接时会踩到）
+        """
+        fut = self._loop.run_in_executor(None, fn, *args)
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            await asyncio.wait([fut])
+            if fn is os.open and fut.exception() is None:
+                os.close(fut.result())      # 打开了但调用方拿不到 fd
+            raise
+
+    async def open(self) -> "FileWriter":
+        self._loop = asyncio.get_running_loop()
+        self._fd = await self._call(os.open, self.path, os.O_WRONLY | os.O_CREAT | _O_BINARY, 0o644)
+        return self
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def write(self, data: bytes):
+        """只进缓冲；满了才真正写"""
+        self._buf += data
+        if len(self._buf) >= self.buffer:
+            await self.flush()
+
+    async def flush(self) -> int:
+        """把缓冲写进文件，periodic 模式到点顺带 fsync；返回 safe_offset"""
+        if self._buf:
+            data, self._buf = self._buf, bytearray()
+            await self._call(_pwrite, self._fd, data, self.offset)
+            self.offset += len(data)
+        if self.durability == "periodic" and time.monotonic() - self._last_sync >= self.sync_interval:
+            await self.sync()
+        return self.safe_offset
+
+    async def sync(self):
+        await self._call(os.fsync, self._fd)
+        self.synced = self.offset
+        self._last_sync = time.monotonic()
+
+    async def close(self):
+        """写完缓冲并关闭；periodic 模式关闭前再 fsync 一次，file 模式由 commit() 统一 fsync"""
+        if self._fd is None:
+            return
+        try:
+            await self.flush()
+            if self.durability == "periodic" and self.synced != self.offset:
+                await self.sync()
+        finally:
+            fd, self._fd = self._fd, None
+            await self._call(os.close, fd)